@@ -0,0 +1,279 @@
+"""ASGI entry point: uvicorn app.asgi:app
+
+Upstream-bound endpoints (POST /api/routes, GET /api/search) run as
+coroutines on the event loop, so a slow Mapbox round-trip holds no thread.
+Route scoring is handed to a thread pool. Alert streams (GET
+/api/alerts/stream) are served on the loop too, each reading its own
+asyncio queue. Every other request is passed to the Flask app on a pool of
+WSGI threads, so both modes serve the same API.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from urllib.parse import parse_qsl
+
+from werkzeug.datastructures import MultiDict
+
+from app.main import app as flask_app
+from app.routes.navigation import get_route_async, SSE_HEARTBEAT
+from app.routes.upload import search_places_async
+from app.utils.metrics import request_latency, requests_total
+from app.utils.push import hazard_hub, format_sse
+from app.utils.upstream import mapbox_async
+
+ASGI_CPU_WORKERS = int(os.getenv('ASGI_CPU_WORKERS', 4))
+ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', 32))
+MAX_JSON_BODY = 1024 * 1024
+SPOOL_SIZE = 64 * 1024
+
+wsgi_executor = ThreadPoolExecutor(ASGI_WSGI_THREADS, thread_name_prefix='asgi-wsgi')
+_configured_loops = set()
+
+
+def _configure_loop():
+    """Run CPU-bound work offloaded with run_in_executor(None, ...) on a bounded pool"""
+    loop = asyncio.get_running_loop()
+    if id(loop) not in _configured_loops:
+        loop.set_default_executor(ThreadPoolExecutor(ASGI_CPU_WORKERS, thread_name_prefix='asgi-cpu'))
+        _configured_loops.add(id(loop))
+
+
+async def route_handler(scope, body):
+    try:
+        data = flask_app.json.loads(body) if body else None
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return {'error': {'code': 'INVALID_REQUEST', 'message': 'JSON body required', 'status': 400}}, 400
+    return await get_route_async(data)
+
+
+async def search_handler(scope, body):
+    args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+    return await search_places_async(args)
+
+
+ASYNC_ROUTES = {
+    ('POST', '/api/routes'): route_handler,
+    ('GET', '/api/search'): search_handler,
+}
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    _configure_loop()
+    key = (scope['method'], scope['path'])
+    if key in STREAM_ROUTES:
+        await STREAM_ROUTES[key](scope, receive, send)
+    elif key in ASYNC_ROUTES:
+        await serve_async(ASYNC_ROUTES[key], scope, receive, send)
+    else:
+        await serve_wsgi(scope, receive, send)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            _configure_loop()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await mapbox_async.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def serve_async(handler, scope, receive, send):
+    """Run a coroutine handler and send its (body, status) like jsonify would"""
+    start = time.perf_counter()
+    body = bytearray()
+    while True:
+        message = await receive()
+        body.extend(message.get('body', b''))
+        if not message.get('more_body') or len(body) > MAX_JSON_BODY:
+            break
+    try:
+        payload, status = await handler(scope, bytes(body))
+    except Exception:
+        payload, status = {'error': {'code': 'SERVER_ERROR', 'message': 'Internal server error', 'status': 500}}, 500
+
+    await send_json(scope, send, payload, status)
+    observe(scope, status, start)
+
+
+def cors_headers(scope):
+    if any(name == b'origin' for name, _ in scope['headers']):
+        return [(b'access-control-allow-origin', b'*')]
+    return []
+
+
+def observe(scope, status, start):
+    labels = (scope['method'], scope['path'], str(status))
+    request_latency.observe(labels, time.perf_counter() - start)
+    requests_total.inc(labels)
+
+
+async def send_json(scope, send, payload, status):
+    """Send payload as a complete JSON response, like jsonify would"""
+    response = flask_app.json.response(payload)
+    headers = [(b'content-type', response.mimetype.encode()),
+               (b'content-length', str(response.content_length).encode())]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers + cors_headers(scope)})
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def serve_alert_stream(scope, receive, send):
+    """GET /api/alerts/stream as a coroutine; an idle subscriber holds no thread"""
+    start = time.perf_counter()
+    args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+    lat = args.get('lat', type=float)
+    lng = args.get('lng', type=float)
+    radius = args.get('radius', 500, type=int)
+
+    if not lat or not lng:
+        await send_json(scope, send, {'error': {'code': 'INVALID_REQUEST', 'message': 'lat and lng required', 'status': 400}}, 400)
+        observe(scope, 400, start)
+        return
+
+    subscription = hazard_hub.subscribe(lat, lng, radius, loop=asyncio.get_running_loop())
+    disconnect = asyncio.ensure_future(wait_disconnect(receive))
+    pending = None
+    try:
+        headers = [(b'content-type', b'text/event-stream; charset=utf-8'),
+                   (b'cache-control', b'no-cache'),
+                   (b'x-accel-buffering', b'no')]
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers + cors_headers(scope)})
+        observe(scope, 200, start)
+        chunk = format_sse({'latitude': lat, 'longitude': lng, 'radius': subscription.radius}, event='ready')
+        while True:
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+            if pending is None:
+                pending = asyncio.ensure_future(subscription.events.get())
+            done, _ = await asyncio.wait({pending, disconnect}, timeout=SSE_HEARTBEAT,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnect in done:
+                return
+            if pending in done:
+                payload = pending.result()
+                pending = None
+                chunk = format_sse(payload, event=payload['event'], event_id=payload['id'])
+            else:
+                # Comment line keeps proxies from closing an idle stream
+                chunk = ': keepalive\n\n'
+    finally:
+        disconnect.cancel()
+        if pending is not None:
+            pending.cancel()
+        hazard_hub.unsubscribe(subscription)
+
+
+STREAM_ROUTES = {
+    ('GET', '/api/alerts/stream'): serve_alert_stream,
+}
+
+
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f"HTTP_{name}"
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+async def serve_wsgi(scope, receive, send):
+    """Run the Flask app on a WSGI thread, streaming its response back.
+
+    A disconnect stops the response iterator at its next chunk.
+    """
+    loop = asyncio.get_running_loop()
+    body = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            body.close()
+            return
+        body.write(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    body.seek(0)
+
+    disconnected = threading.Event()
+    watcher = asyncio.ensure_future(wait_disconnect(receive))
+    watcher.add_done_callback(lambda _: disconnected.set())
+
+    def send_sync(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def run():
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [{
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+            }]
+            return lambda data: None
+
+        result = flask_app(build_environ(scope, body), start_response)
+        try:
+            sent_start = False
+            for chunk in result:
+                if disconnected.is_set():
+                    return
+                if not chunk:
+                    continue
+                if not sent_start:
+                    send_sync(started[0])
+                    sent_start = True
+                send_sync({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not sent_start:
+                send_sync(started[0])
+            send_sync({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    try:
+        await loop.run_in_executor(wsgi_executor, run)
+    finally:
+        watcher.cancel()
+        body.close()
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('app.asgi:app', host='0.0.0.0', port=int(os.getenv('PORT', 8000)))
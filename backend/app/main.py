@@ -5,11 +5,20 @@ import os
 from app.routes.reports import reports_bp
 from app.routes.users import users_bp
 from app.routes.navigation import routes_bp
-from app.routes.upload import upload_bp
+from app.routes.upload import upload_bp, serve_upload
 from app.routes.stats import stats_bp
+from app.utils.metrics import init_app as init_metrics
+from app.utils.photos import MAX_UPLOAD_BYTES
+from app.utils.store import report_store
+from app.utils.votes import vote_store
+from app.utils.users import user_store
+from app.utils.places import place_index
 
 app = Flask(__name__)
+# Enforced while the body is read, so chunked uploads are bounded too
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
 CORS(app)
+init_metrics(app)
 
 # Register blueprints
 app.register_blueprint(reports_bp, url_prefix='/api')
@@ -18,9 +27,22 @@ app.register_blueprint(routes_bp, url_prefix='/api')
 app.register_blueprint(upload_bp, url_prefix='/api')
 app.register_blueprint(stats_bp, url_prefix='/api')
 
+# Photo URLs are handed out as /uploads/<filename>
+app.add_url_rule('/uploads/<filename>', view_func=serve_upload)
+
 # Ensure upload directory exists
 os.makedirs('uploads', exist_ok=True)
 
+# Load reports into memory once; handlers never re-read the file
+report_store.load()
+report_store.start_expiry_scheduler()
+vote_store.load()
+vote_store.start_flusher()
+user_store.load()
+user_store.start_flusher()
+place_index.load()
+place_index.start_flusher()
+
 @app.route('/')
 def root():
     return jsonify({
@@ -51,6 +73,16 @@ def not_found(error):
         }
     }), 404
 
+@app.errorhandler(413)
+def payload_too_large(error):
+    return jsonify({
+        'error': {
+            'code': 'PAYLOAD_TOO_LARGE',
+            'message': f'Upload exceeds {MAX_UPLOAD_BYTES} bytes',
+            'status': 413
+        }
+    }), 413
+
 @app.errorhandler(500)
 def server_error(error):
     return jsonify({
@@ -1,88 +1,152 @@
-from flask import Blueprint, request, jsonify
-import requests
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+import asyncio
 import os
-from app.utils.helpers import calculate_distance, get_direction, load_json_file, is_expired
+import queue
+from app.utils.helpers import get_direction
+from app.utils.cache import TTLCache, round_coord
+from app.utils.push import hazard_hub, format_sse
+from app.utils.scoring import route_scorer, route_rank
+from app.utils.store import report_store, MAX_QUERY_RADIUS
+from app.utils.upstream import mapbox, mapbox_async, MAPBOX_TOKEN, UpstreamError
 
 routes_bp = Blueprint('routes', __name__)
 
-MAPBOX_TOKEN = os.getenv('MAPBOX_TOKEN', 'pk.eyJ1IjoiYWxwaGFpbnN0aW54IiwiYSI6ImNta3A2N3M2dDBldjEzZXFyeTJzeGRhdzMifQ.C7b81YKX5_cWuVFJNOMkoA')
-REPORTS_FILE = 'reports.json'
+directions_cache = TTLCache('directions', maxsize=int(os.getenv('DIRECTIONS_CACHE_SIZE', 512)),
+                            ttl=int(os.getenv('DIRECTIONS_CACHE_TTL', 300)))
 
-@routes_bp.route('/routes', methods=['POST'])
-def get_route():
-    data = request.json
-    origin = data.get('origin')
-    destination = data.get('destination')
-    mode = data.get('mode', 'driving')
-    
-    if not origin or not destination:
-        return jsonify({'error': {'code': 'INVALID_REQUEST', 'message': 'Origin and destination required', 'status': 400}}), 400
-    
-    coords = f"{origin['longitude']},{origin['latitude']};{destination['longitude']},{destination['latitude']}"
-    url = f"https://api.mapbox.com/directions/v5/mapbox/{mode}/{coords}"
+def directions_request(mode, origin_lng, origin_lat, dest_lng, dest_lat):
+    coords = f"{origin_lng},{origin_lat};{dest_lng},{dest_lat}"
     params = {
         'geometries': 'geojson',
         'steps': 'true',
         'alternatives': 'true',
         'access_token': MAPBOX_TOKEN
     }
+    return f"/directions/v5/mapbox/{mode}/{coords}", params
+
+def fetch_directions(*key):
+    return mapbox.get_json(*directions_request(*key))
+
+async def fetch_directions_async(*key):
+    return await mapbox_async.get_json(*directions_request(*key))
+
+def route_key(data):
+    """Directions cache key for a route request, or None if it is incomplete"""
+    origin = data.get('origin')
+    destination = data.get('destination')
+    mode = data.get('mode', 'driving')
+    
+    if not origin or not destination:
+        return None
+    
+    return (
+        mode,
+        round_coord(origin['longitude']), round_coord(origin['latitude']),
+        round_coord(destination['longitude']), round_coord(destination['latitude'])
+    )
+
+def routes_response(data):
+    """Score up to three alternatives of a directions response; returns (body, status)"""
+    if 'routes' not in data or len(data['routes']) == 0:
+        return {'error': {'code': 'NO_ROUTE', 'message': 'No route found', 'status': 404}}, 404
+    
+    candidates = data['routes'][:3]
+    matches = route_scorer.score_all([route['geometry'] for route in candidates])
+    
+    routes = []
+    for idx, (route, match) in enumerate(zip(candidates, matches)):
+        routes.append({
+            'routeIndex': idx,
+            'distance': route['distance'],
+            'duration': route['duration'],
+            'hazardCount': match['hazardCount'],
+            'hazardIds': match['hazardIds'],
+            'nearestHazardDistance': match['nearestHazardDistance'],
+            'hazardCost': match['hazardCost'],
+            'hazardSegments': match['hazardSegments'],
+            'score': round(route_rank(route['duration'], match['hazardCost']), 1),
+            'isSafe': match['hazardCount'] == 0,
+            'geometry': route['geometry'],
+            'steps': route['legs'][0]['steps'][:10] if 'legs' in route else []
+        })
+    
+    # Weighted hazard cost is charged as extra travel time
+    routes.sort(key=lambda x: (x['score'], x['hazardCount']))
+    
+    return {'routes': routes}, 200
+
+@routes_bp.route('/routes', methods=['POST'])
+def get_route():
+    key = route_key(request.json)
+    
+    if key is None:
+        return jsonify({'error': {'code': 'INVALID_REQUEST', 'message': 'Origin and destination required', 'status': 400}}), 400
     
     try:
-        response = requests.get(url, params=params)
-        data = response.json()
-        
-        if 'routes' not in data or len(data['routes']) == 0:
-            return jsonify({'error': {'code': 'NO_ROUTE', 'message': 'No route found', 'status': 404}}), 404
-        
-        reports = load_json_file(REPORTS_FILE)
-        active_reports = [r for r in reports if not is_expired(r['expiresAt'])]
-        
-        routes = []
-        for idx, route in enumerate(data['routes'][:3]):
-            hazard_count = count_hazards_on_route(route['geometry'], active_reports)
-            routes.append({
-                'routeIndex': idx,
-                'distance': route['distance'],
-                'duration': route['duration'],
-                'hazardCount': hazard_count,
-                'isSafe': hazard_count == 0,
-                'geometry': route['geometry'],
-                'steps': route['legs'][0]['steps'][:10] if 'legs' in route else []
-            })
+        # Hazard scores are memoized separately, per geometry and hazard version
+        try:
+            data = directions_cache.get_or_load(key, lambda: fetch_directions(*key), cache_if=lambda d: 'routes' in d)
+        except UpstreamError:
+            # Fall back to an expired cached route rather than failing outright
+            data = directions_cache.get_stale(key)
+            if data is None:
+                return jsonify({'error': {'code': 'UPSTREAM_UNAVAILABLE', 'message': 'Routing service unavailable', 'status': 503}}), 503
         
-        routes.sort(key=lambda x: (x['hazardCount'], x['duration']))
-        
-        return jsonify({'routes': routes})
+        body, status = routes_response(data)
+        return jsonify(body), status
     
     except Exception as e:
         return jsonify({'error': {'code': 'SERVER_ERROR', 'message': str(e), 'status': 500}}), 500
 
-@routes_bp.route('/alerts/check', methods=['POST'])
-def check_alerts():
-    data = request.json
-    lat = data.get('latitude')
-    lng = data.get('longitude')
-    radius = data.get('radius', 500)
+async def get_route_async(data):
+    """ASGI version of get_route; returns (body, status)"""
+    key = route_key(data)
     
-    if not lat or not lng:
-        return jsonify({'error': {'code': 'INVALID_REQUEST', 'message': 'Latitude and longitude required', 'status': 400}}), 400
+    if key is None:
+        return {'error': {'code': 'INVALID_REQUEST', 'message': 'Origin and destination required', 'status': 400}}, 400
     
-    reports = load_json_file(REPORTS_FILE)
-    active_reports = [r for r in reports if not is_expired(r['expiresAt'])]
+    try:
+        try:
+            data = await directions_cache.get_or_load_async(key, lambda: fetch_directions_async(*key),
+                                                            cache_if=lambda d: 'routes' in d)
+        except UpstreamError:
+            data = directions_cache.get_stale(key)
+            if data is None:
+                return {'error': {'code': 'UPSTREAM_UNAVAILABLE', 'message': 'Routing service unavailable', 'status': 503}}, 503
+        
+        # Scoring is CPU-bound; keep it off the event loop
+        return await asyncio.get_running_loop().run_in_executor(None, routes_response, data)
     
+    except Exception as e:
+        return {'error': {'code': 'SERVER_ERROR', 'message': str(e), 'status': 500}}, 500
+
+MAX_BATCH_POINTS = int(os.getenv('MAX_ALERT_BATCH_POINTS', 1000))
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def alert_point(point, default_radius):
+    """Return (lat, lng, radius) for an alert check, or None if malformed"""
+    if not isinstance(point, dict):
+        return None
+    lat, lng = point.get('latitude'), point.get('longitude')
+    radius = point.get('radius', default_radius)
+    if not (is_number(lat) and is_number(lng) and is_number(radius)) or not lat or not lng:
+        return None
+    return lat, lng, min(radius, MAX_QUERY_RADIUS)
+
+def build_alert(lat, lng, matches):
     nearby_hazards = []
-    for report in active_reports:
-        distance = calculate_distance(lat, lng, report['latitude'], report['longitude'])
-        if distance <= radius:
-            direction = get_direction(lat, lng, report['latitude'], report['longitude'])
-            nearby_hazards.append({
-                'id': report['id'],
-                'latitude': report['latitude'],
-                'longitude': report['longitude'],
-                'severity': report['severity'],
-                'distance': int(distance),
-                'direction': direction
-            })
+    for report, distance in matches:
+        direction = get_direction(lat, lng, report['latitude'], report['longitude'])
+        nearby_hazards.append({
+            'id': report['id'],
+            'latitude': report['latitude'],
+            'longitude': report['longitude'],
+            'severity': report['severity'],
+            'distance': int(distance),
+            'direction': direction
+        })
     
     nearby_hazards.sort(key=lambda x: x['distance'])
     
@@ -91,23 +155,89 @@ def check_alerts():
         closest = nearby_hazards[0]
         alert_message = f"⚠️ {closest['severity'].capitalize()} severity waterlogging {closest['distance']}m {closest['direction']}!"
     
-    return jsonify({
+    return {
         'hasHazards': len(nearby_hazards) > 0,
         'hazards': nearby_hazards,
         'alertMessage': alert_message
+    }
+
+@routes_bp.route('/alerts/check', methods=['POST'])
+def check_alerts():
+    point = alert_point(request.json, 500)
+    
+    if point is None:
+        return jsonify({'error': {'code': 'INVALID_REQUEST', 'message': 'Latitude and longitude required', 'status': 400}}), 400
+    
+    lat, lng, radius = point
+    return jsonify(build_alert(lat, lng, report_store.nearby(lat, lng, radius)))
+
+@routes_bp.route('/alerts/check/batch', methods=['POST'])
+def check_alerts_batch():
+    data = request.json or {}
+    points = data.get('points')
+    default_radius = data.get('radius', 500)
+    
+    if not isinstance(points, list) or not points:
+        return jsonify({'error': {'code': 'INVALID_REQUEST', 'message': 'points must be a non-empty list', 'status': 400}}), 400
+    if len(points) > MAX_BATCH_POINTS:
+        return jsonify({'error': {'code': 'INVALID_REQUEST', 'message': f'At most {MAX_BATCH_POINTS} points per batch', 'status': 400}}), 400
+    if not is_number(default_radius):
+        return jsonify({'error': {'code': 'INVALID_REQUEST', 'message': 'radius must be a number', 'status': 400}}), 400
+    
+    # Identical positions (parked vehicles, repeated pings) are looked up once
+    keys = [alert_point(point, default_radius) for point in points]
+    queries = dict.fromkeys(key for key in keys if key is not None)
+    unique = list(queries)
+    for key, matches in zip(unique, report_store.nearby_many(unique)):
+        queries[key] = matches
+    
+    results = []
+    for index, (point, key) in enumerate(zip(points, keys)):
+        if key is None:
+            results.append({
+                'index': index,
+                'error': {'code': 'INVALID_REQUEST', 'message': 'Numeric latitude, longitude and radius required', 'status': 400}
+            })
+            continue
+        result = {'index': index}
+        if 'id' in point:
+            result['id'] = point['id']
+        result.update(build_alert(key[0], key[1], queries[key]))
+        results.append(result)
+    
+    return jsonify({
+        'results': results,
+        'pointsWithHazards': sum(1 for r in results if r.get('hasHazards'))
     })
 
-def count_hazards_on_route(geometry, reports):
-    count = 0
-    coords = geometry['coordinates']
-    threshold = 0.002
+SSE_HEARTBEAT = int(os.getenv('SSE_HEARTBEAT', 15))
+
+@routes_bp.route('/alerts/stream', methods=['GET'])
+def stream_alerts():
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    radius = request.args.get('radius', 500, type=int)
+    
+    if not lat or not lng:
+        return jsonify({'error': {'code': 'INVALID_REQUEST', 'message': 'lat and lng required', 'status': 400}}), 400
+    
+    subscription = hazard_hub.subscribe(lat, lng, radius)
     
-    for report in reports:
-        hazard_point = [report['longitude'], report['latitude']]
-        for coord in coords:
-            distance = ((coord[0] - hazard_point[0])**2 + (coord[1] - hazard_point[1])**2)**0.5
-            if distance < threshold:
-                count += 1
-                break
+    def events():
+        try:
+            yield format_sse({'latitude': lat, 'longitude': lng, 'radius': subscription.radius}, event='ready')
+            while True:
+                try:
+                    payload = subscription.events.get(timeout=SSE_HEARTBEAT)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_sse(payload, event=payload['event'], event_id=payload['id'])
+        finally:
+            hazard_hub.unsubscribe(subscription)
     
-    return count
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,14 +1,17 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from datetime import datetime, timedelta
 from app.utils.auth import require_auth
-from app.utils.helpers import calculate_distance, load_json_file, save_json_file, is_expired
+from app.utils.helpers import calculate_distance
+from app.utils.store import report_store
+from app.utils.tiles import tile_pyramid, MAX_REQUEST_ZOOM
+from app.utils.votes import vote_store
 import base64
+import math
 import os
 
-reports_bp = Blueprint('reports', __name__)
+MAX_CLUSTER_TILES = 64
 
-REPORTS_FILE = 'reports.json'
-VOTES_FILE = 'votes.json'
+reports_bp = Blueprint('reports', __name__)
 
 @reports_bp.route('/reports', methods=['GET'])
 def get_reports():
@@ -16,29 +19,114 @@ def get_reports():
     lng = request.args.get('lng', type=float)
     radius = request.args.get('radius', 10000, type=int)
     
-    reports = load_json_file(REPORTS_FILE)
-    valid_reports = [r for r in reports if not is_expired(r['expiresAt'])]
-    save_json_file(REPORTS_FILE, valid_reports)
+    # The listing only changes when the store version does
+    etag = f"reports-{report_store.current_version()}"
+    if etag in request.if_none_match:
+        return not_modified(etag)
+    
+    valid_reports = report_store.all()
     
     if lat and lng:
-        for report in valid_reports:
-            report['distance'] = int(calculate_distance(lat, lng, report['latitude'], report['longitude']))
-        valid_reports = [r for r in valid_reports if r['distance'] <= radius]
-        valid_reports.sort(key=lambda x: x['distance'])
+        # Query one meter wider so int() truncation matches the old filter
+        nearby_reports = [
+            dict(report, distance=int(distance))
+            for report, distance in report_store.nearby(lat, lng, radius + 1)
+            if int(distance) <= radius
+        ]
+        nearby_reports.sort(key=lambda x: x['distance'])
+        valid_reports = nearby_reports
+    
+    response = jsonify(valid_reports)
+    response.set_etag(etag)
+    return response
+
+@reports_bp.route('/reports/changes', methods=['GET'])
+def get_report_changes():
+    since = request.args.get('since', type=int)
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    radius = request.args.get('radius', 10000, type=int)
+    
+    etag = f"changes-{report_store.current_version()}"
+    if etag in request.if_none_match:
+        return not_modified(etag)
+    
+    changes = report_store.changes_since(since)
+    added, updated = changes['added'], changes['updated']
     
-    return jsonify(valid_reports)
+    if lat and lng:
+        def within_radius(reports):
+            with_distance = []
+            for report in reports:
+                distance = int(calculate_distance(lat, lng, report['latitude'], report['longitude']))
+                if distance <= radius:
+                    with_distance.append(dict(report, distance=distance))
+            return with_distance
+        added, updated = within_radius(added), within_radius(updated)
+    
+    response = jsonify({
+        'cursor': changes['cursor'],
+        'reset': changes['reset'],
+        'added': added,
+        'updated': updated,
+        'removed': changes['removed']
+    })
+    response.set_etag(etag)
+    return response
+
+@reports_bp.route('/reports/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_report_tile(z, x, y):
+    if z > MAX_REQUEST_ZOOM or x >= (1 << z) or y >= (1 << z):
+        return jsonify({'error': {'code': 'INVALID_REQUEST', 'message': 'Invalid tile', 'status': 400}}), 400
+    
+    etag = f"tile-{z}-{x}-{y}-{tile_pyramid.tile_version(z, x, y)}"
+    if etag in request.if_none_match:
+        return not_modified(etag)
+    
+    response = jsonify(tile_pyramid.tile(z, x, y))
+    response.set_etag(etag)
+    return response
+
+@reports_bp.route('/reports/clusters', methods=['GET'])
+def get_report_clusters():
+    zoom = request.args.get('zoom', type=int)
+    try:
+        bbox = [float(v) for v in request.args.get('bbox', '').split(',')]
+        min_lng, min_lat, max_lng, max_lat = bbox
+    except ValueError:
+        return jsonify({'error': {'code': 'INVALID_REQUEST', 'message': 'bbox must be minLng,minLat,maxLng,maxLat', 'status': 400}}), 400
+    
+    if (zoom is None or not 0 <= zoom <= MAX_REQUEST_ZOOM or not all(math.isfinite(v) for v in bbox)
+            or not -90 <= min_lat <= max_lat <= 90 or not -180 <= min_lng <= max_lng <= 180):
+        return jsonify({'error': {'code': 'INVALID_REQUEST', 'message': 'Invalid zoom or bbox', 'status': 400}}), 400
+    
+    tiles = tile_pyramid.tiles_for_bbox(zoom, min_lat, min_lng, max_lat, max_lng, limit=MAX_CLUSTER_TILES)
+    if tiles is None:
+        return jsonify({'error': {'code': 'INVALID_REQUEST', 'message': 'Bounding box too large for zoom', 'status': 400}}), 400
+    
+    clusters = [
+        cluster
+        for x, y in tiles
+        for cluster in tile_pyramid.tile(zoom, x, y)['clusters']
+        if min_lat <= cluster['latitude'] <= max_lat and min_lng <= cluster['longitude'] <= max_lng
+    ]
+    
+    return jsonify({'zoom': zoom, 'clusters': clusters})
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
 
 @reports_bp.route('/reports/<int:report_id>', methods=['GET'])
 def get_report(report_id):
-    reports = load_json_file(REPORTS_FILE)
-    report = next((r for r in reports if r['id'] == report_id), None)
+    report = report_store.get(report_id)
     
     if not report:
+        if report_store.was_expired(report_id):
+            return jsonify({'error': {'code': 'EXPIRED', 'message': 'Report has expired', 'status': 410}}), 410
         return jsonify({'error': {'code': 'NOT_FOUND', 'message': 'Report not found', 'status': 404}}), 404
     
-    if is_expired(report['expiresAt']):
-        return jsonify({'error': {'code': 'EXPIRED', 'message': 'Report has expired', 'status': 410}}), 410
-    
     return jsonify(report)
 
 @reports_bp.route('/reports', methods=['POST'])
@@ -49,8 +137,6 @@ def create_report():
     if not data.get('latitude') or not data.get('longitude'):
         return jsonify({'error': {'code': 'INVALID_REQUEST', 'message': 'Latitude and longitude required', 'status': 400}}), 400
     
-    reports = load_json_file(REPORTS_FILE)
-    
     new_report = {
         'id': int(datetime.now().timestamp() * 1000),
         'latitude': data['latitude'],
@@ -65,16 +151,17 @@ def create_report():
         'expiresAt': (datetime.now() + timedelta(hours=4)).isoformat()
     }
     
-    reports.append(new_report)
-    save_json_file(REPORTS_FILE, reports)
+    # Submissions near an active hazard are merged into it
+    report, merged = report_store.add_or_merge(new_report)
     
-    return jsonify(new_report), 201
+    if merged:
+        return jsonify(dict(report, merged=True)), 200
+    return jsonify(report), 201
 
 @reports_bp.route('/reports/<int:report_id>', methods=['DELETE'])
 @require_auth
 def delete_report(report_id):
-    reports = load_json_file(REPORTS_FILE)
-    report = next((r for r in reports if r['id'] == report_id), None)
+    report = report_store.get(report_id)
     
     if not report:
         return jsonify({'error': {'code': 'NOT_FOUND', 'message': 'Report not found', 'status': 404}}), 404
@@ -82,8 +169,7 @@ def delete_report(report_id):
     if report['userId'] != request.user_id:
         return jsonify({'error': {'code': 'FORBIDDEN', 'message': 'Not authorized', 'status': 403}}), 403
     
-    reports = [r for r in reports if r['id'] != report_id]
-    save_json_file(REPORTS_FILE, reports)
+    report_store.delete(report_id)
     
     return jsonify({'message': 'Report deleted successfully'})
 
@@ -96,42 +182,24 @@ def vote_report(report_id):
     if vote not in [-1, 1]:
         return jsonify({'error': {'code': 'INVALID_VOTE', 'message': 'Vote must be 1 or -1', 'status': 400}}), 400
     
-    reports = load_json_file(REPORTS_FILE)
-    votes = load_json_file(VOTES_FILE)
-    
-    report = next((r for r in reports if r['id'] == report_id), None)
+    report = vote_store.cast(request.user_id, report_id, vote)
     if not report:
         return jsonify({'error': {'code': 'NOT_FOUND', 'message': 'Report not found', 'status': 404}}), 404
     
-    vote_key = f"{request.user_id}_{report_id}"
-    existing_vote = next((v for v in votes if v['key'] == vote_key), None)
-    
-    if existing_vote:
-        report['votes'] -= existing_vote['vote']
-        existing_vote['vote'] = vote
-    else:
-        votes.append({'key': vote_key, 'vote': vote, 'userId': request.user_id, 'reportId': report_id})
-    
-    report['votes'] += vote
-    
-    save_json_file(REPORTS_FILE, reports)
-    save_json_file(VOTES_FILE, votes)
-    
     return jsonify({'reportId': report_id, 'votes': report['votes'], 'userVote': vote})
 
 @reports_bp.route('/reports/<int:report_id>/verify', methods=['POST'])
 @require_auth
 def verify_report(report_id):
-    reports = load_json_file(REPORTS_FILE)
-    report = next((r for r in reports if r['id'] == report_id), None)
+    report = report_store.get(report_id)
     
     if not report:
         return jsonify({'error': {'code': 'NOT_FOUND', 'message': 'Report not found', 'status': 404}}), 404
     
-    report['expiresAt'] = (datetime.now() + timedelta(hours=5)).isoformat()
-    report['verifiedAt'] = datetime.now().isoformat()
-    
-    save_json_file(REPORTS_FILE, reports)
+    report = report_store.update(report_id, {
+        'expiresAt': (datetime.now() + timedelta(hours=5)).isoformat(),
+        'verifiedAt': datetime.now().isoformat()
+    }, reason='verified')
     
     return jsonify({
         'reportId': report_id,
@@ -1,102 +1,287 @@
-from flask import Blueprint, request, jsonify, send_from_directory
+from flask import Blueprint, Response, request, jsonify, send_file, send_from_directory
+from werkzeug.security import safe_join
 import base64
 import os
-from datetime import datetime
-from PIL import Image
-import io
-import requests
+import re
+from app.utils.cache import TTLCache, round_coord
+from app.utils.places import place_index, normalize_query
+from app.utils.photos import (photo_processor, upload_sessions, check_image, content_photo_id, stream_to_file,
+                              variant_filename, PhotoRejected, UploadTooLarge, UPLOAD_FOLDER, MAX_UPLOAD_BYTES, VARIANTS)
+from app.utils.upstream import mapbox, mapbox_async, MAPBOX_TOKEN, UpstreamError
 
 upload_bp = Blueprint('upload', __name__)
 
-UPLOAD_FOLDER = 'uploads'
-MAPBOX_TOKEN = os.getenv('MAPBOX_TOKEN', 'pk.eyJ1IjoiYWxwaGFpbnN0aW54IiwiYSI6ImNta3A2N3M2dDBldjEzZXFyeTJzeGRhdzMifQ.C7b81YKX5_cWuVFJNOMkoA')
+# 'nginx' answers with X-Accel-Redirect, 'sendfile' with X-Sendfile, so the
+# front proxy streams photo bytes instead of a Python worker
+UPLOAD_OFFLOAD = os.getenv('UPLOAD_OFFLOAD', '').lower()
+UPLOAD_ACCEL_PREFIX = os.getenv('UPLOAD_ACCEL_PREFIX', '/_protected_uploads/')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+HASHED_PHOTO = re.compile(r'^(photo_[0-9a-f]{32}(?:_[a-z]+)?)\.jpg$')
 
 @upload_bp.route('/upload', methods=['POST'])
 def upload_photo():
-    if 'photo' in request.files:
-        file = request.files['photo']
-        photo_id = f"photo_{int(datetime.now().timestamp() * 1000)}"
-        filename = f"{photo_id}.jpg"
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        
-        img = Image.open(file)
-        img.thumbnail((1200, 1200))
-        img.save(filepath, 'JPEG', quality=85)
-        
-        file_size = os.path.getsize(filepath)
-        
-        return jsonify({
-            'photoUrl': f"/uploads/{filename}",
-            'photoId': photo_id,
-            'size': file_size,
-            'uploadedAt': datetime.now().isoformat()
-        })
+    if request.content_length and request.content_length > MAX_UPLOAD_BYTES:
+        return jsonify({'error': {'code': 'PAYLOAD_TOO_LARGE', 'message': f'Upload exceeds {MAX_UPLOAD_BYTES} bytes', 'status': 413}}), 413
     
-    elif 'photo' in request.json:
+    upload = request.files.get('photo')
+    if upload is None:
+        # get_data stops quietly at MAX_CONTENT_LENGTH; the extra read raises
+        # the 413 for a chunked body that ran past it instead of letting the
+        # silent JSON parse turn the truncated body into a 400
+        request.get_data(cache=True)
+        request.stream.read(1)
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or 'photo' not in data:
+            return jsonify({'error': {'code': 'NO_FILE', 'message': 'No photo provided', 'status': 400}}), 400
+        photo_data = data['photo']
         try:
-            photo_data = request.json['photo']
+            if not isinstance(photo_data, str):
+                raise ValueError('photo must be a base64 string')
             if ',' in photo_data:
                 photo_data = photo_data.split(',')[1]
-            
-            photo_id = f"photo_{int(datetime.now().timestamp() * 1000)}"
-            filename = f"{photo_id}.jpg"
-            filepath = os.path.join(UPLOAD_FOLDER, filename)
-            
-            img_data = base64.b64decode(photo_data)
-            img = Image.open(io.BytesIO(img_data))
-            img.thumbnail((1200, 1200))
-            img.save(filepath, 'JPEG', quality=85)
-            
-            file_size = os.path.getsize(filepath)
-            
-            return jsonify({
-                'photoUrl': f"/uploads/{filename}",
-                'photoId': photo_id,
-                'size': file_size,
-                'uploadedAt': datetime.now().isoformat()
-            })
-        except Exception as e:
+            photo_bytes = base64.b64decode(photo_data)
+        except ValueError as e:
             return jsonify({'error': {'code': 'UPLOAD_FAILED', 'message': str(e), 'status': 400}}), 400
     
-    return jsonify({'error': {'code': 'NO_FILE', 'message': 'No photo provided', 'status': 400}}), 400
+    # Only created once the body has been read and validated
+    source_path = photo_processor.incoming_path()
+    try:
+        if upload is not None:
+            upload.save(source_path)
+        else:
+            with open(source_path, 'wb') as f:
+                f.write(photo_bytes)
+    except Exception:
+        os.remove(source_path)
+        raise
+    
+    return accept_upload(source_path)
+
+@upload_bp.route('/upload/stream', methods=['POST'])
+def upload_stream():
+    """Raw image body, copied from the socket to disk in fixed-size chunks"""
+    if request.content_length and request.content_length > MAX_UPLOAD_BYTES:
+        return jsonify({'error': {'code': 'PAYLOAD_TOO_LARGE', 'message': f'Upload exceeds {MAX_UPLOAD_BYTES} bytes', 'status': 413}}), 413
+    
+    source_path = photo_processor.incoming_path()
+    try:
+        stream_to_file(request.stream, source_path)
+    except UploadTooLarge as e:
+        os.remove(source_path)
+        return jsonify({'error': {'code': 'PAYLOAD_TOO_LARGE', 'message': str(e), 'status': 413}}), 413
+    except Exception:
+        # Client disconnects mid-body land here; drop the half-written file
+        os.remove(source_path)
+        raise
+    
+    return accept_upload(source_path)
+
+@upload_bp.route('/upload/sessions', methods=['POST'])
+def create_upload_session():
+    total_size = request.headers.get('Upload-Length', type=int)
+    if total_size is None:
+        total_size = (request.get_json(silent=True) or {}).get('size')
+    if not isinstance(total_size, int) or total_size <= 0:
+        return jsonify({'error': {'code': 'INVALID_REQUEST', 'message': 'Upload-Length header or size required', 'status': 400}}), 400
+    
+    try:
+        session = upload_sessions.create(total_size)
+    except UploadTooLarge as e:
+        return jsonify({'error': {'code': 'PAYLOAD_TOO_LARGE', 'message': str(e), 'status': 413}}), 413
+    
+    return jsonify(session_response(session)), 201
+
+@upload_bp.route('/upload/sessions/<upload_id>', methods=['GET'])
+def get_upload_session(upload_id):
+    session = upload_sessions.get(upload_id)
+    if not session:
+        return jsonify({'error': {'code': 'NOT_FOUND', 'message': 'Upload session not found', 'status': 404}}), 404
+    return jsonify(session_response(session))
+
+@upload_bp.route('/upload/sessions/<upload_id>', methods=['PATCH'])
+def upload_chunk(upload_id):
+    session = upload_sessions.get(upload_id)
+    if not session:
+        return jsonify({'error': {'code': 'NOT_FOUND', 'message': 'Upload session not found', 'status': 404}}), 404
+    
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        return jsonify({'error': {'code': 'INVALID_REQUEST', 'message': 'Upload-Offset header required', 'status': 400}}), 400
+    
+    try:
+        appended = upload_sessions.append(session, offset, request.stream)
+    except UploadTooLarge as e:
+        return jsonify({'error': {'code': 'PAYLOAD_TOO_LARGE', 'message': str(e), 'status': 413}}), 413
+    
+    if not appended:
+        return jsonify({
+            'error': {'code': 'OFFSET_MISMATCH', 'message': 'Resume from the current offset', 'status': 409},
+            **session_response(session)
+        }), 409
+    
+    if session['offset'] < session['totalSize']:
+        return jsonify(session_response(session))
+    
+    return accept_upload(upload_sessions.finish(session))
+
+def accept_upload(source_path):
+    """Validate a fully received upload and queue it for processing"""
+    try:
+        check_image(source_path)
+    except PhotoRejected as e:
+        os.remove(source_path)
+        return jsonify({'error': {'code': 'UPLOAD_FAILED', 'message': str(e), 'status': 400}}), 400
+    
+    job = photo_processor.submit(content_photo_id(source_path), source_path)
+    
+    return jsonify(photo_response(job)), 202
+
+def session_response(session):
+    return {
+        'uploadId': session['uploadId'],
+        'offset': session['offset'],
+        'totalSize': session['totalSize'],
+        'uploadUrl': f"/api/upload/sessions/{session['uploadId']}"
+    }
+
+@upload_bp.route('/upload/<photo_id>/status', methods=['GET'])
+def upload_status(photo_id):
+    job = photo_processor.status(photo_id)
+    if not job:
+        return jsonify({'error': {'code': 'NOT_FOUND', 'message': 'Photo not found', 'status': 404}}), 404
+    return jsonify(photo_response(job))
+
+def photo_response(job):
+    photo_id = job['photoId']
+    return {
+        'photoId': photo_id,
+        'photoUrl': f"/uploads/{variant_filename(photo_id)}",
+        'variants': {variant: f"/uploads/{variant_filename(photo_id, variant)}" for variant in VARIANTS},
+        'status': job['status'],
+        'progress': job['progress'],
+        'size': job['size'],
+        'error': job['error'],
+        'statusUrl': f"/api/upload/{photo_id}/status",
+        'uploadedAt': job.get('uploadedAt')
+    }
 
 @upload_bp.route('/uploads/<filename>')
 def serve_upload(filename):
-    return send_from_directory(UPLOAD_FOLDER, filename)
-
-@upload_bp.route('/search', methods=['GET'])
-def search_places():
-    query = request.args.get('q', '')
-    lat = request.args.get('lat', 23.0225)
-    lng = request.args.get('lng', 72.5714)
+    match = HASHED_PHOTO.match(filename)
+    if match is None:
+        # Legacy timestamp-named photos keep default revalidation
+        return send_from_directory(os.path.abspath(UPLOAD_FOLDER), filename)
     
-    if not query:
-        return jsonify({'results': []})
+    # Content-hashed names never change, so the hash is a strong ETag and
+    # a matching If-None-Match needs no disk access at all
+    etag = match.group(1)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        path = safe_join(os.path.abspath(UPLOAD_FOLDER), filename)
+        if path is None or not os.path.isfile(path):
+            return jsonify({'error': {'code': 'NOT_FOUND', 'message': 'Photo not found', 'status': 404}}), 404
+        if UPLOAD_OFFLOAD == 'nginx':
+            response = Response(mimetype='image/jpeg')
+            response.headers['X-Accel-Redirect'] = f"{UPLOAD_ACCEL_PREFIX.rstrip('/')}/{filename}"
+        elif UPLOAD_OFFLOAD == 'sendfile':
+            response = Response(mimetype='image/jpeg')
+            response.headers['X-Sendfile'] = path
+        else:
+            response = send_file(path, mimetype='image/jpeg', conditional=True, etag=False)
     
-    url = f"https://api.mapbox.com/geocoding/v5/mapbox.places/{query}.json"
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return response
+
+GEOCODE_COUNTRY = os.getenv('GEOCODE_COUNTRY', 'IN')  # empty searches worldwide
+DEFAULT_SEARCH_CENTER = (23.0225, 72.5714)
+
+geocode_cache = TTLCache('geocoding', maxsize=int(os.getenv('GEOCODE_CACHE_SIZE', 2048)),
+                         ttl=int(os.getenv('GEOCODE_CACHE_TTL', 86400)))
+
+def places_request(query, lat, lng):
     params = {
         'access_token': MAPBOX_TOKEN,
         'limit': 5,
-        'country': 'IN',
-        'proximity': f"{lng},{lat}",
         'types': 'place,locality,neighborhood,address,poi'
     }
+    if GEOCODE_COUNTRY:
+        params['country'] = GEOCODE_COUNTRY
+    if lat is not None and lng is not None:
+        params['proximity'] = f"{lng},{lat}"
+    return f"/geocoding/v5/mapbox.places/{query}.json", params
+
+def fetch_places(*key):
+    return mapbox.get_json(*places_request(*key))
+
+async def fetch_places_async(*key):
+    return await mapbox_async.get_json(*places_request(*key))
+
+def search_request(args):
+    """Return (query, area, center) for search args, or None for an empty query"""
+    query = normalize_query(args.get('q', ''))
+    lat = args.get('lat', type=float)
+    lng = args.get('lng', type=float)
+    
+    if not query:
+        return None
+    
+    # Upstream is biased to the searcher only when they sent a position
+    if lat is not None and lng is not None:
+        return query, (round_coord(lat, 2), round_coord(lng, 2)), (lat, lng)
+    return query, (None, None), DEFAULT_SEARCH_CENTER
+
+@upload_bp.route('/search', methods=['GET'])
+def search_places():
+    search = search_request(request.args)
+    
+    if search is None:
+        return jsonify({'results': []})
+    
+    query, area, center = search
+    key = (query,) + area
+    
+    def fetch():
+        try:
+            return geocode_cache.get_or_load(key, lambda: fetch_places(*key), cache_if=lambda d: 'features' in d)
+        except UpstreamError:
+            data = geocode_cache.get_stale(key)
+            if data is None:
+                raise
+            return data
     
     try:
-        response = requests.get(url, params=params)
-        data = response.json()
-        
-        results = []
-        for feature in data.get('features', []):
-            results.append({
-                'name': feature['text'],
-                'address': feature['place_name'],
-                'latitude': feature['center'][1],
-                'longitude': feature['center'][0],
-                'type': feature['place_type'][0] if feature.get('place_type') else 'place'
-            })
-        
+        # Degrades to whatever the local index has when Mapbox is unavailable
+        results = place_index.autocomplete(query, center[0], center[1], fetch, area=area)
         return jsonify({'results': results})
     
     except Exception as e:
         return jsonify({'error': {'code': 'SEARCH_FAILED', 'message': str(e), 'status': 500}}), 500
+
+async def search_places_async(args):
+    """ASGI version of search_places; returns (body, status)"""
+    search = search_request(args)
+    
+    if search is None:
+        return {'results': []}, 200
+    
+    query, area, center = search
+    key = (query,) + area
+    
+    async def fetch():
+        try:
+            return await geocode_cache.get_or_load_async(key, lambda: fetch_places_async(*key),
+                                                         cache_if=lambda d: 'features' in d)
+        except UpstreamError:
+            data = geocode_cache.get_stale(key)
+            if data is None:
+                raise
+            return data
+    
+    try:
+        results = await place_index.autocomplete_async(query, center[0], center[1], fetch, area=area)
+        return {'results': results}, 200
+    
+    except Exception as e:
+        return {'error': {'code': 'SEARCH_FAILED', 'message': str(e), 'status': 500}}, 500
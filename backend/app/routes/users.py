@@ -1,13 +1,9 @@
 from flask import Blueprint, request, jsonify
-from datetime import datetime
-from app.utils.auth import generate_token, require_auth
-from app.utils.helpers import load_json_file, save_json_file
+from app.utils.auth import generate_token, require_auth, revoke_token
+from app.utils.users import user_store
 
 users_bp = Blueprint('users', __name__)
 
-USERS_FILE = 'users.json'
-REPORTS_FILE = 'reports.json'
-
 @users_bp.route('/users/register', methods=['POST'])
 def register():
     data = request.json
@@ -16,55 +12,34 @@ def register():
     if not device_id:
         return jsonify({'error': {'code': 'INVALID_REQUEST', 'message': 'Device ID required', 'status': 400}}), 400
     
-    users = load_json_file(USERS_FILE)
-    existing_user = next((u for u in users if u['deviceId'] == device_id), None)
-    
-    if existing_user:
-        token = generate_token(existing_user['userId'])
-        return jsonify({
-            'userId': existing_user['userId'],
-            'token': token,
-            'createdAt': existing_user['createdAt']
-        })
-    
-    user_id = f"user_{int(datetime.now().timestamp() * 1000)}"
-    new_user = {
-        'userId': user_id,
-        'deviceId': device_id,
-        'name': data.get('name', ''),
-        'phone': data.get('phone', ''),
-        'fcmToken': data.get('fcmToken', ''),
-        'createdAt': datetime.now().isoformat()
-    }
+    user, created = user_store.register(
+        device_id,
+        name=data.get('name', ''),
+        phone=data.get('phone', ''),
+        fcm_token=data.get('fcmToken', '')
+    )
     
-    users.append(new_user)
-    save_json_file(USERS_FILE, users)
-    
-    token = generate_token(user_id)
+    token = generate_token(user['userId'])
     
     return jsonify({
-        'userId': user_id,
+        'userId': user['userId'],
         'token': token,
-        'createdAt': new_user['createdAt']
-    }), 201
+        'createdAt': user['createdAt']
+    }), 201 if created else 200
 
 @users_bp.route('/users/me', methods=['GET'])
 @require_auth
 def get_profile():
-    users = load_json_file(USERS_FILE)
-    user = next((u for u in users if u['userId'] == request.user_id), None)
+    user = user_store.get(request.user_id)
     
     if not user:
         return jsonify({'error': {'code': 'NOT_FOUND', 'message': 'User not found', 'status': 404}}), 404
     
-    reports = load_json_file(REPORTS_FILE)
-    user_reports = [r for r in reports if r.get('userId') == request.user_id]
-    
     return jsonify({
         'userId': user['userId'],
         'name': user.get('name', ''),
         'phone': user.get('phone', ''),
-        'reportsCount': len(user_reports),
+        'reportsCount': user_store.report_count(request.user_id),
         'joinedAt': user['createdAt']
     })
 
@@ -72,16 +47,22 @@ def get_profile():
 @require_auth
 def update_profile():
     data = request.json
-    users = load_json_file(USERS_FILE)
-    user = next((u for u in users if u['userId'] == request.user_id), None)
+    user = user_store.get(request.user_id)
     
     if not user:
         return jsonify({'error': {'code': 'NOT_FOUND', 'message': 'User not found', 'status': 404}}), 404
     
-    user['name'] = data.get('name', user.get('name', ''))
-    user['phone'] = data.get('phone', user.get('phone', ''))
-    user['fcmToken'] = data.get('fcmToken', user.get('fcmToken', ''))
-    
-    save_json_file(USERS_FILE, users)
+    user_store.update(request.user_id, {
+        'name': data.get('name', user.get('name', '')),
+        'phone': data.get('phone', user.get('phone', '')),
+        'fcmToken': data.get('fcmToken', user.get('fcmToken', ''))
+    })
     
     return jsonify({'message': 'Profile updated successfully'})
+
+@users_bp.route('/users/logout', methods=['POST'])
+@require_auth
+def logout():
+    revoke_token(request.token)
+    
+    return jsonify({'message': 'Logged out successfully'})
@@ -0,0 +1,21 @@
+# Civix Backend Storage
+import os
+
+from app.storage.base import StorageBackend
+from app.storage.json_backend import JsonBackend
+from app.storage.sqlite_backend import SqliteBackend
+
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json').lower()
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'civix.db')
+
+
+def create_backend(kind=STORAGE_BACKEND):
+    """Build the backend named by STORAGE_BACKEND ('json' or 'sqlite')"""
+    if kind == 'sqlite':
+        return SqliteBackend(SQLITE_PATH)
+    if kind == 'json':
+        return JsonBackend()
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+storage = create_backend()
@@ -0,0 +1,95 @@
+# Civix Backend Storage
+
+
+class StorageBackend:
+    """Persistence interface behind the in-memory report, vote and user stores.
+
+    The stores keep their working set in memory and call these methods to
+    make each change durable. Backends with ``shared = True`` can be used by
+    several worker processes at once; stores then poll ``report_changes``
+    to pick up writes made by other workers, and use its sequence numbers
+    as their version.
+    """
+
+    shared = False
+
+    # Reports
+
+    def load_reports(self):
+        raise NotImplementedError
+
+    def put_report(self, report):
+        raise NotImplementedError
+
+    def update_report(self, report_id, fields):
+        raise NotImplementedError
+
+    def increment_report(self, report_id, field, delta):
+        """Atomically add delta to a numeric field and return the new value"""
+        raise NotImplementedError
+
+    def delete_report(self, report_id):
+        raise NotImplementedError
+
+    def get_report(self, report_id):
+        raise NotImplementedError
+
+    def report_changes(self, since):
+        """Return (cursor, [(seq, report_id, remote)]) for writes after since.
+
+        ``seq`` orders every write across workers; ``remote`` is true for
+        writes made by other workers. ``since=None`` returns the current
+        cursor and no changes.
+        """
+        return since, []
+
+    # Votes
+
+    def load_votes(self):
+        raise NotImplementedError
+
+    def save_votes(self, votes, removed_report_ids):
+        """Persist changed vote records and drop votes for removed reports"""
+        raise NotImplementedError
+
+    def cast_vote(self, user_id, report_id, vote):
+        """Record a vote and adjust the tally in one write; return the new tally"""
+        raise NotImplementedError
+
+    # Users
+
+    def load_users(self):
+        raise NotImplementedError
+
+    def put_user(self, user):
+        raise NotImplementedError
+
+    def save_users(self, users):
+        """Persist a batch of new or changed user records"""
+        for user in users:
+            self.put_user(user)
+
+    def create_user(self, user):
+        """Insert user unless its deviceId is taken; return the stored user"""
+        raise NotImplementedError
+
+    def get_user(self, user_id):
+        raise NotImplementedError
+
+    def find_user_by_device(self, device_id):
+        raise NotImplementedError
+
+    def count_users(self):
+        return len(self.load_users())
+
+    # Revoked tokens
+
+    def load_revocations(self, since=None):
+        """Return (cursor, {token digest: expiry}) for revocations after since"""
+        raise NotImplementedError
+
+    def revoke_token(self, digest, expires):
+        raise NotImplementedError
+
+    def close(self):
+        pass
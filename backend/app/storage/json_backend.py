@@ -0,0 +1,245 @@
+# Civix Backend Storage
+import json
+import os
+import threading
+import time
+
+from app.storage.base import StorageBackend
+from app.utils.helpers import load_json_file
+from app.utils.metrics import timed
+
+REPORTS_FILE = 'reports.json'
+VOTES_FILE = 'votes.json'
+USERS_FILE = 'users.json'
+REVOCATIONS_FILE = 'revocations.json'
+COMPACT_EVERY = int(os.getenv('STORE_COMPACT_EVERY', 500))
+
+
+@timed('json_save')
+def write_json_atomic(filename, data):
+    """Write JSON to a temp file, fsync it and rename it over filename"""
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+
+class JsonBackend(StorageBackend):
+    """Legacy single-process storage in reports.json, votes.json, users.json
+    and revocations.json.
+
+    Report writes append one line to ``reports.json.journal``; after
+    ``compact_every`` entries the snapshot is rewritten atomically and the
+    journal is truncated. Journal operations set absolute values, so replaying
+    a journal on top of a snapshot that already contains it is harmless.
+    A vote is journaled as one entry carrying both the vote record and the
+    report's new tally; compaction also rewrites votes.json. Vote removals,
+    users and revocations are rewritten whole, atomically.
+    """
+
+    def __init__(self, reports_file=REPORTS_FILE, votes_file=VOTES_FILE, users_file=USERS_FILE,
+                 compact_every=COMPACT_EVERY, revocations_file=REVOCATIONS_FILE):
+        self.reports_file = reports_file
+        self.journal_file = f"{reports_file}.journal"
+        self.votes_file = votes_file
+        self.users_file = users_file
+        self.revocations_file = revocations_file
+        self.compact_every = compact_every
+        self._reports = {}
+        self._votes = None
+        self._votes_dirty = False
+        self._users = None
+        self._revocations = None
+        self._lock = threading.RLock()
+        self._journal = None
+        self._journal_entries = 0
+
+    # Reports
+
+    def load_reports(self):
+        with self._lock:
+            self._reports = {r['id']: r for r in load_json_file(self.reports_file)}
+            if self._replay_journal():
+                self.compact()
+            return list(self._reports.values())
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_file):
+            return 0
+        count = 0
+        with open(self.journal_file, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-append
+                    break
+                self._apply(entry)
+                count += 1
+        return count
+
+    def _apply(self, entry):
+        op = entry['op']
+        if op == 'put':
+            self._reports[entry['report']['id']] = entry['report']
+        elif op == 'update':
+            report = self._reports.get(entry['id'])
+            if report is not None:
+                report.update(entry['fields'])
+        elif op == 'delete':
+            self._reports.pop(entry['id'], None)
+        elif op == 'vote':
+            report = self._reports.get(entry['id'])
+            if report is not None:
+                report.update(entry['fields'])
+            self._vote_records()[entry['vote']['key']] = entry['vote']
+            self._votes_dirty = True
+
+    @timed('journal_append')
+    def _log(self, entry):
+        if self._journal is None:
+            self._journal = open(self.journal_file, 'a')
+        self._journal.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        self._journal.flush()
+        self._journal_entries += 1
+        if self._journal_entries >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Write a fresh snapshot via atomic rename and truncate the journal"""
+        with self._lock:
+            write_json_atomic(self.reports_file, list(self._reports.values()))
+            if self._votes_dirty:
+                write_json_atomic(self.votes_file, list(self._votes.values()))
+                self._votes_dirty = False
+            if self._journal is not None:
+                self._journal.close()
+            self._journal = open(self.journal_file, 'w')
+            self._journal_entries = 0
+
+    def put_report(self, report):
+        with self._lock:
+            self._reports[report['id']] = report
+            self._log({'op': 'put', 'report': report})
+
+    def update_report(self, report_id, fields):
+        with self._lock:
+            entry = {'op': 'update', 'id': report_id, 'fields': fields}
+            self._apply(entry)
+            self._log(entry)
+
+    def increment_report(self, report_id, field, delta):
+        with self._lock:
+            report = self._reports.get(report_id)
+            if report is None:
+                return None
+            value = report[field] + delta
+            self.update_report(report_id, {field: value})
+            return value
+
+    def delete_report(self, report_id):
+        with self._lock:
+            if self._reports.pop(report_id, None) is not None:
+                self._log({'op': 'delete', 'id': report_id})
+
+    def get_report(self, report_id):
+        return self._reports.get(report_id)
+
+    # Votes
+
+    def _vote_records(self):
+        if self._votes is None:
+            self._votes = {v['key']: v for v in load_json_file(self.votes_file)}
+        return self._votes
+
+    def load_votes(self):
+        with self._lock:
+            return list(self._vote_records().values())
+
+    def save_votes(self, votes, removed_report_ids):
+        with self._lock:
+            records = self._vote_records()
+            for vote in votes:
+                records[vote['key']] = vote
+            if removed_report_ids:
+                removed = set(removed_report_ids)
+                self._votes = {k: v for k, v in records.items() if v['reportId'] not in removed}
+            write_json_atomic(self.votes_file, list(self._votes.values()))
+            self._votes_dirty = False
+
+    def cast_vote(self, user_id, report_id, vote):
+        key = f"{user_id}_{report_id}"
+        with self._lock:
+            report = self._reports.get(report_id)
+            if report is None:
+                return None
+            existing = self._vote_records().get(key)
+            tally = report['votes'] + vote - (existing['vote'] if existing else 0)
+            entry = {'op': 'vote', 'id': report_id, 'fields': {'votes': tally},
+                     'vote': {'key': key, 'userId': user_id, 'reportId': report_id, 'vote': vote}}
+            self._apply(entry)
+            self._log(entry)
+            return tally
+
+    # Users
+
+    def load_users(self):
+        with self._lock:
+            if self._users is None:
+                self._users = {u['userId']: u for u in load_json_file(self.users_file)}
+            return list(self._users.values())
+
+    def put_user(self, user):
+        self.save_users([user])
+
+    def save_users(self, users):
+        with self._lock:
+            self.load_users()
+            for user in users:
+                self._users[user['userId']] = user
+            write_json_atomic(self.users_file, list(self._users.values()))
+
+    def create_user(self, user):
+        with self._lock:
+            existing = self.find_user_by_device(user['deviceId'])
+            if existing is not None:
+                return existing
+            self.save_users([user])
+            return user
+
+    def get_user(self, user_id):
+        self.load_users()
+        return self._users.get(user_id)
+
+    def find_user_by_device(self, device_id):
+        self.load_users()
+        return next((u for u in self._users.values() if u['deviceId'] == device_id), None)
+
+    def count_users(self):
+        self.load_users()
+        return len(self._users)
+
+    # Revoked tokens
+
+    def load_revocations(self, since=None):
+        with self._lock:
+            if self._revocations is None:
+                self._revocations = load_json_file(self.revocations_file) or {}
+            return None, dict(self._revocations)
+
+    def revoke_token(self, digest, expires):
+        with self._lock:
+            self.load_revocations()
+            # Entries are only needed until the token would have expired anyway
+            now = time.time()
+            self._revocations = {d: e for d, e in self._revocations.items() if e > now}
+            self._revocations[digest] = expires
+            write_json_atomic(self.revocations_file, self._revocations)
+
+    def close(self):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
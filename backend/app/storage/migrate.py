@@ -0,0 +1,50 @@
+# Civix Backend Storage
+"""Import reports.json, votes.json, users.json and revocations.json into SQLite.
+
+Run from the directory holding the JSON files:
+
+    python -m app.storage.migrate --db civix.db
+
+Pending entries in reports.json.journal are applied first. Rows are
+upserted, so running the migration twice is safe.
+"""
+import argparse
+
+from app.storage.json_backend import JsonBackend, REPORTS_FILE, VOTES_FILE, USERS_FILE
+from app.storage.sqlite_backend import SqliteBackend
+
+
+def migrate(source, target):
+    """Copy every report, vote, user and token revocation from source to target backend"""
+    reports = source.load_reports()
+    for report in reports:
+        target.put_report(report)
+    report_ids = {r['id'] for r in reports}
+    votes = [v for v in source.load_votes() if v['reportId'] in report_ids]
+    target.save_votes(votes, [])
+    users = source.load_users()
+    target.save_users(users)
+    _, revoked = source.load_revocations()
+    for digest, expires in revoked.items():
+        target.revoke_token(digest, expires)
+    return {'reports': len(reports), 'votes': len(votes), 'users': len(users)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='civix.db', help='SQLite database to create or update')
+    parser.add_argument('--reports', default=REPORTS_FILE)
+    parser.add_argument('--votes', default=VOTES_FILE)
+    parser.add_argument('--users', default=USERS_FILE)
+    args = parser.parse_args()
+
+    source = JsonBackend(args.reports, args.votes, args.users)
+    target = SqliteBackend(args.db)
+    counts = migrate(source, target)
+    source.close()
+    target.close()
+    print(f"Imported {counts['reports']} reports, {counts['votes']} votes and {counts['users']} users into {args.db}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+# Civix Backend Storage
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+from app.storage.base import StorageBackend
+from app.utils.helpers import iso_timestamp
+from app.utils.metrics import stage
+
+CHANGES_RETAINED = 100000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    expires_ts REAL NOT NULL,
+    user_id TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reports_lat_lng ON reports (latitude, longitude);
+CREATE INDEX IF NOT EXISTS idx_reports_expires ON reports (expires_ts);
+CREATE INDEX IF NOT EXISTS idx_reports_user ON reports (user_id);
+
+CREATE TABLE IF NOT EXISTS votes (
+    key TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    report_id INTEGER NOT NULL,
+    vote INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_votes_report ON votes (report_id);
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    device_id TEXT UNIQUE,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS report_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    report_id INTEGER NOT NULL,
+    origin TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    digest TEXT UNIQUE NOT NULL,
+    expires REAL NOT NULL
+);
+'''
+
+
+class SqliteBackend(StorageBackend):
+    """SQLite storage in WAL mode, safe to share between worker processes.
+
+    Reports are stored as JSON with latitude, longitude and expiry copied
+    into indexed columns. Every report write also appends to
+    ``report_changes`` tagged with this process's origin id, which is how
+    other workers find out what to reload. Its sequence numbers double as
+    the stores' delta-sync cursors.
+    """
+
+    shared = True
+
+    def __init__(self, path):
+        self.path = path
+        self.origin = uuid.uuid4().hex
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute('PRAGMA busy_timeout=5000')
+            self._local.db = db
+        return db
+
+    def _transaction(self):
+        return _Transaction(self._connect())
+
+    def _changed(self, db, report_id):
+        cursor = db.execute('INSERT INTO report_changes (report_id, origin) VALUES (?, ?)',
+                            (report_id, self.origin))
+        if cursor.lastrowid % 1000 == 0:
+            db.execute('DELETE FROM report_changes WHERE seq <= ?', (cursor.lastrowid - CHANGES_RETAINED,))
+
+    @staticmethod
+    def _row_values(report):
+        return (report['id'], report['latitude'], report['longitude'],
+                iso_timestamp(report['expiresAt']), report.get('userId'), json.dumps(report))
+
+    # Reports
+
+    def load_reports(self):
+        rows = self._connect().execute('SELECT data FROM reports').fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def put_report(self, report):
+        with self._transaction() as db:
+            db.execute('INSERT OR REPLACE INTO reports (id, latitude, longitude, expires_ts, user_id, data) '
+                       'VALUES (?, ?, ?, ?, ?, ?)', self._row_values(report))
+            self._changed(db, report['id'])
+
+    def _modify(self, db, report_id, change):
+        row = db.execute('SELECT data FROM reports WHERE id = ?', (report_id,)).fetchone()
+        if row is None:
+            return None
+        report = json.loads(row[0])
+        change(report)
+        db.execute('UPDATE reports SET latitude = ?, longitude = ?, expires_ts = ?, user_id = ?, data = ? '
+                   'WHERE id = ?', self._row_values(report)[1:] + (report_id,))
+        self._changed(db, report_id)
+        return report
+
+    def update_report(self, report_id, fields):
+        with self._transaction() as db:
+            self._modify(db, report_id, lambda report: report.update(fields))
+
+    def increment_report(self, report_id, field, delta):
+        with self._transaction() as db:
+            report = self._modify(db, report_id, lambda r: r.update({field: r[field] + delta}))
+            return report[field] if report is not None else None
+
+    def delete_report(self, report_id):
+        with self._transaction() as db:
+            if db.execute('DELETE FROM reports WHERE id = ?', (report_id,)).rowcount:
+                db.execute('DELETE FROM votes WHERE report_id = ?', (report_id,))
+                self._changed(db, report_id)
+
+    def get_report(self, report_id):
+        row = self._connect().execute('SELECT data FROM reports WHERE id = ?', (report_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def report_changes(self, since):
+        db = self._connect()
+        if since is None:
+            row = db.execute('SELECT MAX(seq) FROM report_changes').fetchone()
+            return row[0] or 0, []
+        rows = db.execute('SELECT seq, report_id, origin FROM report_changes WHERE seq > ? ORDER BY seq',
+                          (since,)).fetchall()
+        cursor = rows[-1][0] if rows else since
+        return cursor, [(seq, report_id, origin != self.origin) for seq, report_id, origin in rows]
+
+    # Votes
+
+    def load_votes(self):
+        rows = self._connect().execute('SELECT key, user_id, report_id, vote FROM votes').fetchall()
+        return [{'key': key, 'userId': user_id, 'reportId': report_id, 'vote': vote}
+                for key, user_id, report_id, vote in rows]
+
+    def save_votes(self, votes, removed_report_ids):
+        with self._transaction() as db:
+            db.executemany('INSERT OR REPLACE INTO votes (key, user_id, report_id, vote) VALUES (?, ?, ?, ?)',
+                           [(v['key'], v['userId'], v['reportId'], v['vote']) for v in votes])
+            db.executemany('DELETE FROM votes WHERE report_id = ?', [(i,) for i in removed_report_ids])
+
+    def cast_vote(self, user_id, report_id, vote):
+        key = f"{user_id}_{report_id}"
+        with self._transaction() as db:
+            row = db.execute('SELECT vote FROM votes WHERE key = ?', (key,)).fetchone()
+            delta = vote - (row[0] if row else 0)
+            report = self._modify(db, report_id, lambda r: r.update({'votes': r['votes'] + delta}))
+            if report is None:
+                return None
+            db.execute('INSERT OR REPLACE INTO votes (key, user_id, report_id, vote) VALUES (?, ?, ?, ?)',
+                       (key, user_id, report_id, vote))
+            return report['votes']
+
+    # Users
+
+    def load_users(self):
+        rows = self._connect().execute('SELECT data FROM users').fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def put_user(self, user):
+        self.save_users([user])
+
+    def save_users(self, users):
+        with self._transaction() as db:
+            db.executemany('INSERT OR REPLACE INTO users (user_id, device_id, data) VALUES (?, ?, ?)',
+                           [(u['userId'], u['deviceId'], json.dumps(u)) for u in users])
+
+    def create_user(self, user):
+        with self._transaction() as db:
+            db.execute('INSERT OR IGNORE INTO users (user_id, device_id, data) VALUES (?, ?, ?)',
+                       (user['userId'], user['deviceId'], json.dumps(user)))
+            row = db.execute('SELECT data FROM users WHERE device_id = ?', (user['deviceId'],)).fetchone()
+            return json.loads(row[0])
+
+    def get_user(self, user_id):
+        row = self._connect().execute('SELECT data FROM users WHERE user_id = ?', (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find_user_by_device(self, device_id):
+        row = self._connect().execute('SELECT data FROM users WHERE device_id = ?', (device_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def count_users(self):
+        return self._connect().execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+    # Revoked tokens
+
+    def load_revocations(self, since=None):
+        rows = self._connect().execute('SELECT seq, digest, expires FROM revoked_tokens WHERE seq > ? ORDER BY seq',
+                                       (since or 0,)).fetchall()
+        cursor = rows[-1][0] if rows else since
+        now = time.time()
+        return cursor, {digest: expires for _, digest, expires in rows if expires > now}
+
+    def revoke_token(self, digest, expires):
+        with self._transaction() as db:
+            cursor = db.execute('INSERT OR IGNORE INTO revoked_tokens (digest, expires) VALUES (?, ?)',
+                                (digest, expires))
+            if cursor.lastrowid and cursor.lastrowid % 1000 == 0:
+                db.execute('DELETE FROM revoked_tokens WHERE expires <= ?', (time.time(),))
+
+    def close(self):
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, rolling back if the block raises"""
+
+    def __init__(self, db):
+        self.db = db
+        self._stage = stage('sqlite_transaction')
+
+    def __enter__(self):
+        self._stage.__enter__()
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return self._stage.__exit__(exc_type, exc, tb)
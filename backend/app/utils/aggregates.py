@@ -0,0 +1,144 @@
+# Civix Backend Utils
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+from app.utils.store import report_store
+
+AREA_PRECISION = 2  # decimal places, roughly 1.1 km cells
+HOURLY_WINDOW = int(os.getenv('STATS_HOURLY_WINDOW', 24))
+REMOVED_EVENTS = {'deleted', 'expired'}
+
+
+class TopK:
+    """Counts with the highest ones readable without sorting.
+
+    Keys are bucketed by count, so incrementing or decrementing a key moves
+    it between neighbouring buckets in O(1) and ``most_common(k)`` walks
+    down from the highest bucket until it has k keys.
+    """
+
+    def __init__(self):
+        self._counts = {}
+        self._buckets = {}
+        self._max = 0
+
+    def __len__(self):
+        return len(self._counts)
+
+    def _move(self, key, old, new):
+        if old:
+            bucket = self._buckets[old]
+            del bucket[key]
+            if not bucket:
+                del self._buckets[old]
+        if new:
+            self._buckets.setdefault(new, {})[key] = None
+            self._counts[key] = new
+        else:
+            self._counts.pop(key, None)
+
+    def add(self, key, delta=1):
+        old = self._counts.get(key, 0)
+        new = max(old + delta, 0)
+        self._move(key, old, new)
+        if new > self._max:
+            self._max = new
+        while self._max and self._max not in self._buckets:
+            self._max -= 1
+
+    def most_common(self, k):
+        result = []
+        count = self._max
+        while count > 0 and len(result) < k:
+            for key in self._buckets.get(count, ()):
+                result.append((key, count))
+                if len(result) == k:
+                    break
+            count -= 1
+        return result
+
+
+class ReportStats:
+    """Report aggregates kept current from store events.
+
+    Every live report contributes to the per-area and per-severity counts;
+    its contribution is remembered so an update or removal can take it back
+    out without rescanning. Creation counts (the running total, today's and
+    the last ``HOURLY_WINDOW`` hours') only ever go up, so they are kept
+    after the reports themselves expire. The total starts from the reports
+    loaded from storage.
+    """
+
+    def __init__(self, reports=report_store):
+        self.reports = reports
+        self._contributions = {}
+        self._created = 0
+        self._created_by_day = Counter()
+        self._by_severity = Counter()
+        self._areas = TopK()
+        self._hourly = Counter()
+        self._lock = threading.Lock()
+        reports.subscribe(self._on_report_event)
+
+    @staticmethod
+    def _contribution(report):
+        area = (round(report['latitude'], AREA_PRECISION), round(report['longitude'], AREA_PRECISION))
+        return area, report['severity']
+
+    def _apply(self, contribution, delta):
+        area, severity = contribution
+        self._by_severity[severity] += delta
+        if self._by_severity[severity] <= 0:
+            del self._by_severity[severity]
+        self._areas.add(area, delta)
+
+    def _on_report_event(self, event, report):
+        with self._lock:
+            old = self._contributions.pop(report['id'], None)
+            if old is not None:
+                self._apply(old, -1)
+            if event in REMOVED_EVENTS:
+                return
+            new = self._contribution(report)
+            self._contributions[report['id']] = new
+            self._apply(new, 1)
+            if event in ('created', 'loaded') and old is None:
+                self._created += 1
+                self._created_by_day[report['createdAt'][:10]] += 1
+                self._hourly[report['createdAt'][:13]] += 1
+                self._trim()
+
+    def _trim(self):
+        if len(self._created_by_day) > 1:
+            today = datetime.now().date().isoformat()
+            for day in [d for d in self._created_by_day if d < today]:
+                del self._created_by_day[day]
+        if len(self._hourly) <= HOURLY_WINDOW:
+            return
+        oldest = (datetime.now() - timedelta(hours=HOURLY_WINDOW - 1)).isoformat()[:13]
+        for hour in [h for h in self._hourly if h < oldest]:
+            del self._hourly[hour]
+
+    def snapshot(self, top=5):
+        """Return the aggregates in the shape served by ``/api/stats``"""
+        # Reading the store's length evicts anything that has just expired
+        active = len(self.reports)
+        now = datetime.now()
+        hours = [(now - timedelta(hours=i)).isoformat()[:13] for i in range(HOURLY_WINDOW - 1, -1, -1)]
+        with self._lock:
+            return {
+                'totalReports': self._created,
+                'activeReports': active,
+                'reportsToday': self._created_by_day.get(now.date().isoformat(), 0),
+                'topAreas': [
+                    {'name': f"{lat}, {lng}", 'reportCount': count}
+                    for (lat, lng), count in self._areas.most_common(top)
+                ],
+                'bySeverity': dict(self._by_severity),
+                'hourly': [{'hour': f"{hour}:00", 'reportCount': self._hourly.get(hour, 0)} for hour in hours]
+            }
+
+
+report_stats = ReportStats()
@@ -1,10 +1,85 @@
 import jwt
+import hashlib
 import os
+import threading
+import time
 from datetime import datetime, timedelta
 from functools import wraps
 from flask import request, jsonify
+from jwt.algorithms import HMACAlgorithm
+from app.storage import storage
+from app.utils.cache import TTLCache
 
 SECRET_KEY = os.getenv('SECRET_KEY', 'civix-secret-key-change-in-production')
+ALGORITHM = 'HS256'
+TOKEN_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', 10000))
+TOKEN_CACHE_TTL = int(os.getenv('AUTH_CACHE_TTL', 600))
+REVOCATION_SYNC_INTERVAL = float(os.getenv('STORE_SYNC_INTERVAL', 0.25))
+
+# Prepared once instead of on every encode/decode
+SIGNING_KEY = HMACAlgorithm(HMACAlgorithm.SHA256).prepare_key(SECRET_KEY)
+
+# token digest -> (user_id, exp); a hit skips signature verification
+verified_tokens = TTLCache('auth_tokens', maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
+class AuthError(Exception):
+    """A request's credentials were rejected"""
+    code = 'INVALID_TOKEN'
+    message = 'Invalid token'
+
+class TokenMissing(AuthError):
+    code = 'UNAUTHORIZED'
+    message = 'Token required'
+
+class TokenExpired(AuthError):
+    message = 'Token expired'
+
+class TokenRevoked(AuthError):
+    message = 'Token revoked'
+
+class Revocations:
+    """Revoked token digests, checked in O(1) and persisted by the storage backend.
+
+    The set is loaded on first use. With a shared backend it is refreshed
+    every ``REVOCATION_SYNC_INTERVAL`` seconds, so a logout on one worker
+    reaches the others.
+    """
+
+    def __init__(self, backend=storage):
+        self.backend = backend
+        self._tokens = None
+        self._cursor = None
+        self._next_sync = 0
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        if self._tokens is not None and not (self.backend.shared and time.monotonic() >= self._next_sync):
+            return
+        with self._lock:
+            self._next_sync = time.monotonic() + REVOCATION_SYNC_INTERVAL
+            self._cursor, tokens = self.backend.load_revocations(self._cursor)
+            if self._tokens is None:
+                self._tokens = {}
+            self._tokens.update(tokens)
+
+    def revoke_token(self, digest, exp):
+        self._sync()
+        self.backend.revoke_token(digest, exp)
+        with self._lock:
+            self._tokens[digest] = exp
+            # Entries are only needed until the token would have expired anyway
+            if len(self._tokens) % 1000 == 0:
+                now = time.time()
+                self._tokens = {d: e for d, e in self._tokens.items() if e > now}
+
+    def is_revoked(self, digest):
+        self._sync()
+        return digest in self._tokens
+
+revocations = Revocations()
+
+def token_digest(token):
+    return hashlib.sha256(token.encode()).hexdigest()
 
 def generate_token(user_id):
     payload = {
@@ -12,26 +87,61 @@ def generate_token(user_id):
         'exp': datetime.utcnow() + timedelta(days=365),
         'iat': datetime.utcnow()
     }
-    return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
+    return jwt.encode(payload, SIGNING_KEY, algorithm=ALGORITHM)
+
+def _decode(token):
+    try:
+        payload = jwt.decode(token, SIGNING_KEY, algorithms=[ALGORITHM])
+    except jwt.ExpiredSignatureError as e:
+        raise TokenExpired() from e
+    except jwt.InvalidTokenError as e:
+        raise AuthError() from e
+    if 'user_id' not in payload:
+        raise AuthError()
+    return payload['user_id'], payload.get('exp', float('inf'))
+
+def authenticate(token):
+    """Return the user id for a token or raise an AuthError subclass.
+
+    Verified tokens are cached by digest, so repeat requests with the same
+    token skip the HMAC check; ``exp`` and revocation are still checked on
+    every call.
+    """
+    if not token:
+        raise TokenMissing()
+    digest = token_digest(token)
+    user_id, exp = verified_tokens.get_or_load(digest, lambda: _decode(token))
+    if exp <= time.time():
+        raise TokenExpired()
+    if revocations.is_revoked(digest):
+        raise TokenRevoked()
+    return user_id
 
 def verify_token(token):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        return payload['user_id']
-    except:
+        return authenticate(token)
+    except AuthError:
         return None
 
+def revoke_token(token):
+    """Revoke one token; returns False if it was not valid to begin with"""
+    try:
+        user_id, exp = _decode(token)
+    except AuthError:
+        return False
+    revocations.revoke_token(token_digest(token), exp)
+    return True
+
 def require_auth(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         token = request.headers.get('Authorization', '').replace('Bearer ', '')
-        if not token:
-            return jsonify({'error': {'code': 'UNAUTHORIZED', 'message': 'Token required', 'status': 401}}), 401
-        
-        user_id = verify_token(token)
-        if not user_id:
-            return jsonify({'error': {'code': 'INVALID_TOKEN', 'message': 'Invalid token', 'status': 401}}), 401
-        
+        try:
+            user_id = authenticate(token)
+        except AuthError as e:
+            return jsonify({'error': {'code': e.code, 'message': e.message, 'status': 401}}), 401
+
         request.user_id = user_id
+        request.token = token
         return f(*args, **kwargs)
     return decorated
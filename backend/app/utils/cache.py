@@ -0,0 +1,169 @@
+# Civix Backend Utils
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+CACHES = {}
+
+
+class TTLCache:
+    """Bounded LRU cache with per-entry expiry and single-flight loading.
+
+    ``get_or_load`` lets exactly one caller run the loader for a missing key;
+    concurrent callers for the same key wait for that result instead of
+    issuing their own upstream request.
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=300):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        CACHES[name] = self
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def get_stale(self, key):
+        """Return a value even if its TTL has passed, for degraded responses"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[1] if entry is not None else None
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_load(self, key, loader, cache_if=None):
+        """Return the cached value for key, calling loader() once on a miss.
+
+        Values for which ``cache_if(value)`` is false are handed to waiting
+        callers but not stored.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            flight = self._inflight.get(key)
+            if flight is None:
+                flight = self._inflight[key] = _Flight()
+                leader = True
+                self.misses += 1
+            else:
+                leader = False
+                self.coalesced += 1
+
+        if not leader:
+            return flight.wait()
+
+        try:
+            value = loader()
+        except Exception as e:
+            flight.fail(e)
+            raise
+        else:
+            if cache_if is None or cache_if(value):
+                self.set(key, value)
+            flight.resolve(value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def get_or_load_async(self, key, loader, cache_if=None):
+        """``get_or_load`` for coroutines: concurrent callers await one task.
+
+        Must be called from a single event loop. The shared task is shielded
+        so a caller that is cancelled does not cancel the others.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            task = self._tasks.get(key)
+            if task is None:
+                task = self._tasks[key] = asyncio.ensure_future(self._load_async(key, loader, cache_if))
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _load_async(self, key, loader, cache_if):
+        try:
+            value = await loader()
+            if cache_if is None or cache_if(value):
+                self.set(key, value)
+            return value
+        finally:
+            with self._lock:
+                self._tasks.pop(key, None)
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced
+        }
+
+
+class _Flight:
+    """Result handoff between a single-flight leader and its waiters"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._value = None
+        self._error = None
+
+    def resolve(self, value):
+        self._value = value
+        self._event.set()
+
+    def fail(self, error):
+        self._error = error
+        self._event.set()
+
+    def wait(self):
+        self._event.wait()
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+def round_coord(value, places=4):
+    """Round a coordinate for cache keys (4 places is about 11 m)"""
+    return round(float(value), places)
+
+
+def cache_stats():
+    """Return hit/miss counters for every registered cache"""
+    return {name: cache.stats() for name, cache in CACHES.items()}
@@ -0,0 +1,49 @@
+# Civix Backend Utils
+from array import array
+
+from app.utils.spatial import GridIndex, DEFAULT_CELL_SIZE
+
+SEVERITIES = ('LOW', 'MEDIUM', 'HIGH')
+SEVERITY_CODES = {name: code for code, name in enumerate(SEVERITIES)}
+
+
+class ReportColumns(GridIndex):
+    """Grid index over reports with their timestamps as packed columns.
+
+    Next to the id, latitude and longitude columns every report has its
+    expiry and the time it was last reported (epoch seconds) in arrays at
+    the same row. The store checks whether an expiry-heap entry is current
+    and whether a new report falls in the dedup window without parsing
+    ``expiresAt`` or ``lastReportedAt``.
+    """
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        super().__init__(cell_size)
+        self.expires = array('d')
+        self.reported = array('d')
+
+    def _columns(self):
+        return super()._columns() + [self.expires, self.reported]
+
+    def _append_row(self):
+        self.expires.append(0.0)
+        self.reported.append(0.0)
+
+    def put(self, report, expires, reported):
+        """Insert or refresh a report's row; returns the row"""
+        row = self.insert(report['id'], report['latitude'], report['longitude'])
+        self.expires[row] = expires
+        self.reported[row] = reported
+        return row
+
+    def expires_at(self, report_id):
+        row = self.row(report_id)
+        return self.expires[row] if row is not None else None
+
+    def reported_at(self, report_id):
+        row = self.row(report_id)
+        return self.reported[row] if row is not None else None
+
+    def nbytes(self):
+        """Bytes held by the packed numeric columns"""
+        return sum(c.itemsize * len(c) for c in (self.lat, self.lng, self.expires, self.reported))
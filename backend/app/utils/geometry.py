@@ -0,0 +1,69 @@
+# Civix Backend Utils
+import math
+from collections import defaultdict
+
+METERS_PER_DEGREE = 111320
+ROUTE_HAZARD_THRESHOLD = 200  # meters, close to the old 0.002 degree check
+
+
+class LocalProjection:
+    """Equirectangular projection to meters around a reference latitude"""
+
+    def __init__(self, ref_lat):
+        self.kx = METERS_PER_DEGREE * math.cos(math.radians(ref_lat))
+        self.ky = METERS_PER_DEGREE
+
+    def __call__(self, lng, lat):
+        return lng * self.kx, lat * self.ky
+
+
+def point_segment_distance(px, py, ax, ay, bx, by):
+    """Distance from point P to segment AB in projected meters"""
+    dx = bx - ax
+    dy = by - ay
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return math.hypot(px - ax, py - ay)
+    t = ((px - ax) * dx + (py - ay) * dy) / length_sq
+    t = max(0.0, min(1.0, t))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+class SegmentGrid:
+    """Buckets route segments into square cells for hazard lookups.
+
+    Cells are ``2 * threshold`` wide and every segment is registered in the
+    cells of points sampled along it every ``threshold / 2`` meters, so any
+    point within ``threshold`` of a segment is found by checking its own cell
+    and the eight neighbours.
+    """
+
+    def __init__(self, points, threshold):
+        self.points = points
+        self.cell_size = 2 * threshold
+        self._cells = defaultdict(set)
+        step = threshold / 2
+        for i in range(len(points) - 1):
+            (ax, ay), (bx, by) = points[i], points[i + 1]
+            samples = max(1, int(math.hypot(bx - ax, by - ay) / step) + 1)
+            for k in range(samples + 1):
+                t = k / samples
+                self._cells[self._cell(ax + t * (bx - ax), ay + t * (by - ay))].add(i)
+
+    def _cell(self, x, y):
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def nearest_segment(self, x, y):
+        """Return (distance, segment index) for the closest segment near (x, y), or None"""
+        col, row = self._cell(x, y)
+        segments = set()
+        for dc in (-1, 0, 1):
+            for dr in (-1, 0, 1):
+                segments.update(self._cells.get((col + dc, row + dr), ()))
+        best = None
+        for i in segments:
+            (ax, ay), (bx, by) = self.points[i], self.points[i + 1]
+            distance = point_segment_distance(x, y, ax, ay, bx, by)
+            if best is None or distance < best[0]:
+                best = (distance, i)
+        return best
@@ -2,6 +2,7 @@ import math
 import os
 import json
 from datetime import datetime
+from app.utils.metrics import timed
 
 def calculate_distance(lat1, lon1, lat2, lon2):
     """Calculate distance between two points in meters using Haversine formula"""
@@ -30,6 +31,7 @@ def get_direction(lat1, lon1, lat2, lon2):
     index = round(bearing / 45) % 8
     return directions[index]
 
+@timed('json_load')
 def load_json_file(filename):
     """Load data from JSON file"""
     if os.path.exists(filename):
@@ -37,6 +39,7 @@ def load_json_file(filename):
             return json.load(f)
     return []
 
+@timed('json_save')
 def save_json_file(filename, data):
     """Save data to JSON file"""
     with open(filename, 'w') as f:
@@ -45,3 +48,7 @@ def save_json_file(filename, data):
 def is_expired(expires_at):
     """Check if a timestamp has expired"""
     return datetime.fromisoformat(expires_at) < datetime.now()
+
+def iso_timestamp(value):
+    """Convert an ISO timestamp to epoch seconds"""
+    return datetime.fromisoformat(value).timestamp()
@@ -0,0 +1,245 @@
+# Civix Backend Utils
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import Response, g, request
+
+from app.utils.cache import CACHES
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PROFILE_SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', 0))  # 0 disables the profiler
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.005))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+
+
+def _labels(names, values):
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram per label set"""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, (list(s[0]), s[1], s[2])) for labels, s in self._series.items())
+        for labels, (counts, total, count) in series:
+            base = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{base}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {count}")
+        return lines
+
+
+class CounterMetric:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{{{_labels(self.label_names, labels)}}} {value}")
+        return lines
+
+
+request_latency = Histogram('civix_request_duration_seconds', 'Request latency by route',
+                            ('method', 'route', 'status'))
+requests_total = CounterMetric('civix_requests_total', 'Requests served by route', ('method', 'route', 'status'))
+stage_latency = Histogram('civix_stage_duration_seconds', 'Time spent in instrumented stages', ('stage',))
+stage_errors = CounterMetric('civix_stage_errors_total', 'Instrumented stages that raised', ('stage',))
+slow_profiles = CounterMetric('civix_slow_request_profiles_total', 'Slow requests dumped by the profiler', ('route',))
+
+
+@contextmanager
+def stage(name):
+    """Time a block under civix_stage_duration_seconds{stage=name}"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors.inc((name,))
+        raise
+    finally:
+        stage_latency.observe((name,), time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator form of ``stage``"""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class SamplingProfiler:
+    """Samples the stacks of threads serving requests.
+
+    A background thread reads ``sys._current_frames()`` every ``interval``
+    seconds for each thread that has an open request and counts the stacks
+    it sees. Requests slower than the threshold have their counts written
+    as collapsed stacks (``frame;frame;frame count``), which flamegraph.pl
+    and speedscope read directly.
+    """
+
+    def __init__(self, threshold_ms, interval=PROFILE_INTERVAL, directory=PROFILE_DIR):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.directory = directory
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def begin(self):
+        samples = Counter()
+        with self._lock:
+            self._active[threading.get_ident()] = samples
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+        return samples
+
+    def end(self, samples, duration, route):
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+        if duration < self.threshold or not samples:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        safe_route = route.strip('/').replace('/', '_').replace('<', '').replace('>', '') or 'root'
+        path = os.path.join(self.directory, f"{int(time.time() * 1000)}-{safe_route}-{int(duration * 1000)}ms.folded")
+        with open(path, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        slow_profiles.inc((route,))
+        return path
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for ident, samples in active:
+                frame = frames.get(ident)
+                if frame is not None:
+                    samples[self._collapse(frame)] += 1
+
+    @staticmethod
+    def _collapse(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+
+profiler = SamplingProfiler(PROFILE_SLOW_MS) if PROFILE_SLOW_MS > 0 else None
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    if profiler is not None:
+        g.profile_samples = profiler.begin()
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+
+
+def _after_request(response):
+    start = g.get('metrics_start')
+    if start is None:
+        return response
+    labels = (request.method, _route(), str(response.status_code))
+    request_latency.observe(labels, time.perf_counter() - start)
+    requests_total.inc(labels)
+    return response
+
+
+def _teardown_request(error=None):
+    # Runs even when a view raises past the error handlers, so the sampler
+    # never carries one request's stacks into the next on this thread
+    start = g.pop('metrics_start', None)
+    samples = g.pop('profile_samples', None)
+    if samples is not None:
+        profiler.end(samples, time.perf_counter() - start, _route())
+
+
+def extra_metrics():
+    """Cache counters kept by TTLCache, in exposition format"""
+    lines = ['# HELP civix_cache_requests_total Cache lookups by result',
+             '# TYPE civix_cache_requests_total counter']
+    for name, cache in sorted(CACHES.items()):
+        stats = cache.stats()
+        for result in ('hits', 'misses', 'coalesced'):
+            lines.append(f'civix_cache_requests_total{{{_labels(("cache", "result"), (name, result))}}} {stats[result]}')
+    lines.append('# HELP civix_cache_entries Entries currently cached')
+    lines.append('# TYPE civix_cache_entries gauge')
+    for name, cache in sorted(CACHES.items()):
+        lines.append(f'civix_cache_entries{{{_labels(("cache",), (name,))}}} {len(cache)}')
+    return lines
+
+
+def render_metrics():
+    lines = []
+    for metric in (request_latency, requests_total, stage_latency, stage_errors, slow_profiles):
+        lines.extend(metric.render())
+    lines.extend(extra_metrics())
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """Install request timing hooks and the /metrics endpoint"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/metrics', view_func=metrics_view)
@@ -0,0 +1,244 @@
+# Civix Backend Utils
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from PIL import Image
+
+from app.utils.metrics import timed
+
+UPLOAD_FOLDER = 'uploads'
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', 15 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', 40_000_000))
+PHOTO_WORKERS = int(os.getenv('PHOTO_WORKERS', 2))
+MAX_TRACKED_JOBS = 10000
+CHUNK_SIZE = 64 * 1024
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', 24 * 3600))
+
+PHOTO_SIZE = (1200, 1200)
+VARIANTS = {
+    'small': (640, 640),
+    'thumb': (240, 240)
+}
+
+
+class PhotoRejected(Exception):
+    """The upload is not an acceptable image"""
+
+
+class UploadTooLarge(PhotoRejected):
+    """The upload exceeds MAX_UPLOAD_BYTES"""
+
+
+def stream_to_file(stream, path, already_written=0, limit=MAX_UPLOAD_BYTES):
+    """Copy a byte stream to the end of path in fixed-size chunks.
+
+    Only one chunk is held in memory at a time. Returns the number of bytes
+    written; raises UploadTooLarge once the file would pass ``limit``.
+    """
+    written = 0
+    with open(path, 'ab') as f:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            if already_written + written > limit:
+                raise UploadTooLarge(f"Upload exceeds {limit} bytes")
+            f.write(chunk)
+    return written
+
+
+def content_photo_id(path):
+    """Derive a photo id from the SHA-256 of the uploaded bytes"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return f"photo_{digest.hexdigest()[:32]}"
+
+
+def variant_filename(photo_id, variant=None):
+    return f"{photo_id}_{variant}.jpg" if variant else f"{photo_id}.jpg"
+
+
+def check_image(path):
+    """Read only the image header and enforce the pixel-count limit"""
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+    except (OSError, Image.DecompressionBombError) as e:
+        raise PhotoRejected('Not a readable image') from e
+    if width * height > MAX_IMAGE_PIXELS:
+        raise PhotoRejected(f"Image has {width * height} pixels, limit is {MAX_IMAGE_PIXELS}")
+
+
+class PhotoProcessor:
+    """Resizes uploaded photos on a worker pool and tracks their progress.
+
+    ``submit`` takes ownership of a temporary source file and returns at
+    once; the resized photo and its variants are written in the background
+    and ``status`` reports how far along a job is.
+    """
+
+    def __init__(self, upload_folder=UPLOAD_FOLDER, workers=PHOTO_WORKERS):
+        self.upload_folder = upload_folder
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='photo')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def incoming_path(self):
+        """Return a fresh temp file path for an upload awaiting processing"""
+        incoming = os.path.join(self.upload_folder, '.incoming')
+        os.makedirs(incoming, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=incoming)
+        os.close(fd)
+        return path
+
+    def submit(self, photo_id, source_path):
+        """Queue source_path for processing unless photo_id already exists.
+
+        Photo ids are content hashes, so a repeat upload of the same bytes
+        discards the new file and returns the existing job instead.
+        """
+        with self._lock:
+            existing = self._jobs.get(photo_id)
+        if existing is None:
+            existing = self.status(photo_id)
+        if existing is not None and existing['status'] != 'failed':
+            os.remove(source_path)
+            return existing
+        job = {
+            'photoId': photo_id,
+            'status': 'pending',
+            'progress': 0.0,
+            'size': None,
+            'error': None,
+            'uploadedAt': datetime.now().isoformat()
+        }
+        with self._lock:
+            if photo_id in self._jobs and self._jobs[photo_id]['status'] != 'failed':
+                # Lost a race with an identical concurrent upload
+                os.remove(source_path)
+                return self._jobs[photo_id]
+            self._jobs[photo_id] = job
+            while len(self._jobs) > MAX_TRACKED_JOBS:
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._process, job, source_path)
+        return job
+
+    def status(self, photo_id):
+        with self._lock:
+            job = self._jobs.get(photo_id)
+        if job is not None:
+            return dict(job)
+        # Jobs from before a restart or evicted from tracking
+        path = os.path.join(self.upload_folder, variant_filename(photo_id))
+        if os.path.exists(path):
+            return {'photoId': photo_id, 'status': 'done', 'progress': 1.0,
+                    'size': os.path.getsize(path), 'error': None}
+        return None
+
+    @timed('photo_process')
+    def _process(self, job, source_path):
+        job['status'] = 'processing'
+        steps = 1 + len(VARIANTS)
+        try:
+            with Image.open(source_path) as img:
+                # For JPEGs, decode at a reduced scale instead of full size
+                img.draft('RGB', PHOTO_SIZE)
+                img = img.convert('RGB')
+                img.thumbnail(PHOTO_SIZE)
+                main_path = os.path.join(self.upload_folder, variant_filename(job['photoId']))
+                img.save(main_path, 'JPEG', quality=85)
+                job['size'] = os.path.getsize(main_path)
+                job['progress'] = 1 / steps
+
+                # Variants are ordered largest first, so each shrinks the last
+                for done, (variant, size) in enumerate(VARIANTS.items(), start=2):
+                    img.thumbnail(size)
+                    img.save(os.path.join(self.upload_folder, variant_filename(job['photoId'], variant)),
+                             'JPEG', quality=80)
+                    job['progress'] = done / steps
+            job['status'] = 'done'
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+        finally:
+            os.remove(source_path)
+
+
+class UploadSessions:
+    """Resumable uploads assembled from sequential chunks.
+
+    A session owns an incoming temp file and the byte offset received so
+    far; clients that lose their connection ask for the offset and resume
+    from there.
+    """
+
+    def __init__(self, processor):
+        self.processor = processor
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, total_size):
+        if total_size > MAX_UPLOAD_BYTES:
+            raise UploadTooLarge(f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+        self._prune()
+        session = {
+            'uploadId': uuid.uuid4().hex,
+            'path': self.processor.incoming_path(),
+            'offset': 0,
+            'totalSize': total_size,
+            'lock': threading.Lock(),
+            'touched': time.monotonic()
+        }
+        with self._lock:
+            self._sessions[session['uploadId']] = session
+        return session
+
+    def get(self, upload_id):
+        with self._lock:
+            return self._sessions.get(upload_id)
+
+    def append(self, session, offset, stream):
+        """Append a chunk at offset; returns False if offset is not current"""
+        with session['lock']:
+            if offset != session['offset']:
+                return False
+            try:
+                session['offset'] += stream_to_file(stream, session['path'], session['offset'],
+                                                    limit=session['totalSize'])
+            except Exception:
+                # Drop the partial chunk (too large, disconnect) so the client can retry from offset
+                with open(session['path'], 'ab') as f:
+                    f.truncate(session['offset'])
+                raise
+            session['touched'] = time.monotonic()
+            return True
+
+    def finish(self, session):
+        """Forget a completed session, handing its file to the caller"""
+        with self._lock:
+            self._sessions.pop(session['uploadId'], None)
+        return session['path']
+
+    def _prune(self):
+        cutoff = time.monotonic() - UPLOAD_SESSION_TTL
+        with self._lock:
+            stale = [s for s in self._sessions.values() if s['touched'] < cutoff]
+            for session in stale:
+                del self._sessions[session['uploadId']]
+        for session in stale:
+            if os.path.exists(session['path']):
+                os.remove(session['path'])
+
+
+photo_processor = PhotoProcessor()
+upload_sessions = UploadSessions(photo_processor)
@@ -0,0 +1,301 @@
+# Civix Backend Utils
+import asyncio
+import atexit
+import math
+import os
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+from app.storage.json_backend import write_json_atomic
+from app.utils.helpers import calculate_distance, load_json_file
+from app.utils.upstream import UpstreamError
+
+PLACES_FILE = os.getenv('PLACES_FILE', 'places.json')
+PLACES_INDEX_SIZE = int(os.getenv('PLACES_INDEX_SIZE', 50000))
+SEARCH_MIN_LOCAL_RESULTS = int(os.getenv('SEARCH_MIN_LOCAL_RESULTS', 3))
+SEARCH_COALESCE_WAIT = float(os.getenv('SEARCH_COALESCE_WAIT', 2))
+PROXIMITY_SCALE = 10000  # meters of distance that cost as much as e-fold popularity
+FLUSH_INTERVAL = float(os.getenv('PLACES_FLUSH_INTERVAL', 30))
+TOKEN = re.compile(r'\w+')
+
+
+def normalize_query(query):
+    return ' '.join(TOKEN.findall(query.lower()))
+
+
+def place_from_feature(feature):
+    """Search result fields from a Mapbox geocoding feature"""
+    return {
+        'name': feature['text'],
+        'address': feature['place_name'],
+        'latitude': feature['center'][1],
+        'longitude': feature['center'][0],
+        'type': feature['place_type'][0] if feature.get('place_type') else 'place'
+    }
+
+
+class _Flight:
+    """An upstream lookup in progress; threads and coroutines can wait for it"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._waiters = []
+        self._lock = threading.Lock()
+
+    def wait(self, timeout):
+        return self._event.wait(timeout)
+
+    async def wait_async(self, timeout):
+        """Wait on the caller's event loop, without holding a thread"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self._event.is_set():
+                return True
+            self._waiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def set(self):
+        with self._lock:
+            self._event.set()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_release, future)
+            except RuntimeError:
+                pass  # loop closed while waiting
+
+
+def _release(future):
+    if not future.done():
+        future.set_result(True)
+
+
+class PlaceIndex:
+    """Autocomplete over places already resolved by the geocoder.
+
+    Every place returned by Mapbox is kept with a popularity count, and each
+    word of its name and address goes into a sorted list of
+    ``(token, address)`` pairs. A prefix query bisects that list for its
+    longest word, keeps the places matching every other word and ranks them
+    by popularity and distance from the searcher. Only queries with too few
+    local matches go upstream.
+
+    While a query is in flight upstream, identical or longer queries from
+    the same area wait for it and are then answered from the index, so
+    typing "ahm", "ahme", "ahmed" costs one upstream call. The index is
+    written to ``places.json`` in the background and reloaded at startup.
+    """
+
+    def __init__(self, filename=PLACES_FILE, maxsize=PLACES_INDEX_SIZE):
+        self.filename = filename
+        self.maxsize = maxsize
+        self._places = {}
+        self._tokens = []
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._loaded = False
+        self.local_hits = 0
+        self.upstream_calls = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._places)
+
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            for place in load_json_file(self.filename):
+                self._insert(place)
+            self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def _insert(self, place):
+        key = place['address']
+        existing = self._places.get(key)
+        if existing is not None:
+            existing.update({k: v for k, v in place.items() if k not in ('hits', 'tokens')})
+            return existing
+        place = dict(place, hits=place.get('hits', 0))
+        place['tokens'] = sorted(set(TOKEN.findall(f"{place['name']} {place['address']}".lower())))
+        self._places[key] = place
+        for token in place['tokens']:
+            insort(self._tokens, (token, key))
+        return place
+
+    def _evict(self):
+        """Drop the least popular tenth once the index is over size"""
+        if len(self._places) <= self.maxsize:
+            return
+        keep = sorted(self._places.values(), key=lambda p: p['hits'], reverse=True)[:self.maxsize * 9 // 10]
+        self._places = {p['address']: p for p in keep}
+        self._tokens = sorted((token, p['address']) for p in keep for token in p['tokens'])
+
+    def add(self, places):
+        """Index places from an upstream response; returns the indexed records"""
+        self._ensure_loaded()
+        with self._lock:
+            records = [self._insert(place) for place in places]
+            for record in records:
+                record['hits'] += 1
+            self._evict()
+            self._dirty = True
+            return [self._result(record) for record in records]
+
+    @staticmethod
+    def _result(place):
+        return {k: place[k] for k in ('name', 'address', 'latitude', 'longitude', 'type')}
+
+    def search(self, query, lat, lng, limit=5):
+        """Rank indexed places matching every word of query as a prefix"""
+        self._ensure_loaded()
+        words = TOKEN.findall(query.lower())
+        if not words:
+            return []
+        longest = max(words, key=len)
+        with self._lock:
+            start = bisect_left(self._tokens, (longest,))
+            keys = set()
+            for token, key in self._tokens[start:]:
+                if not token.startswith(longest):
+                    break
+                keys.add(key)
+            matches = [self._places[key] for key in keys
+                       if all(any(t.startswith(w) for t in self._places[key]['tokens']) for w in words)]
+            scored = sorted(matches, key=lambda p: (
+                -(math.log1p(p['hits']) - calculate_distance(lat, lng, p['latitude'], p['longitude']) / PROXIMITY_SCALE),
+                len(p['name'])))
+            return [self._result(place) for place in scored[:limit]]
+
+    def _pending(self, query, area):
+        """An upstream lookup in flight for this query or a prefix of it"""
+        with self._lock:
+            for (pending, pending_area), flight in self._inflight.items():
+                if pending_area == area and query.startswith(pending):
+                    return flight
+        return None
+
+    def _local(self, query, lat, lng, limit):
+        """Return (results, enough) from the index alone"""
+        results = self.search(query, lat, lng, limit)
+        if len(results) >= min(limit, SEARCH_MIN_LOCAL_RESULTS):
+            self._touch(results)
+            return results, True
+        return results, False
+
+    def _begin_flight(self, query, area):
+        with self._lock:
+            return self._inflight.setdefault((query, area), _Flight())
+
+    def _end_flight(self, query, area, flight):
+        with self._lock:
+            self._inflight.pop((query, area), None)
+        flight.set()
+
+    def autocomplete(self, query, lat, lng, fetch, area=None, limit=5):
+        """Answer from the index, going upstream through fetch() on a miss.
+
+        ``fetch`` returns a geocoding response. If it raises UpstreamError
+        whatever the index has is returned instead.
+        """
+        query = normalize_query(query)
+        results, enough = self._local(query, lat, lng, limit)
+        if enough:
+            self.local_hits += 1
+            return results
+
+        flight = self._pending(query, area)
+        if flight is not None:
+            self.coalesced += 1
+            flight.wait(SEARCH_COALESCE_WAIT)
+            results, enough = self._local(query, lat, lng, limit)
+            if enough:
+                return results
+
+        flight = self._begin_flight(query, area)
+        self.upstream_calls += 1
+        try:
+            data = fetch()
+            # Indexed before waiters are released, so they can answer locally
+            return self.add([place_from_feature(f) for f in data.get('features', [])])
+        except UpstreamError:
+            return results
+        finally:
+            self._end_flight(query, area, flight)
+
+    async def autocomplete_async(self, query, lat, lng, fetch, area=None, limit=5):
+        """``autocomplete`` for the ASGI app; fetch is a coroutine function"""
+        query = normalize_query(query)
+        results, enough = self._local(query, lat, lng, limit)
+        if enough:
+            self.local_hits += 1
+            return results
+
+        flight = self._pending(query, area)
+        if flight is not None:
+            self.coalesced += 1
+            await flight.wait_async(SEARCH_COALESCE_WAIT)
+            results, enough = self._local(query, lat, lng, limit)
+            if enough:
+                return results
+
+        flight = self._begin_flight(query, area)
+        self.upstream_calls += 1
+        try:
+            data = await fetch()
+            return self.add([place_from_feature(f) for f in data.get('features', [])])
+        except UpstreamError:
+            return results
+        finally:
+            self._end_flight(query, area, flight)
+
+    def _touch(self, results):
+        with self._lock:
+            for result in results:
+                place = self._places.get(result['address'])
+                if place is not None:
+                    place['hits'] += 1
+            self._dirty = True
+
+    def stats(self):
+        return {
+            'places': len(self._places),
+            'localHits': self.local_hits,
+            'upstreamCalls': self.upstream_calls,
+            'coalesced': self.coalesced
+        }
+
+    def flush(self):
+        """Write the index to disk if it changed"""
+        with self._lock:
+            if not self._dirty:
+                return False
+            places = [{k: v for k, v in p.items() if k != 'tokens'} for p in self._places.values()]
+            self._dirty = False
+        write_json_atomic(self.filename, places)
+        return True
+
+    def start_flusher(self, interval=FLUSH_INTERVAL):
+        def run():
+            while True:
+                time.sleep(interval)
+                self.flush()
+
+        thread = threading.Thread(target=run, name='places-flush', daemon=True)
+        thread.start()
+        return thread
+
+
+place_index = PlaceIndex()
+atexit.register(place_index.flush)
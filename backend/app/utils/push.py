@@ -0,0 +1,139 @@
+# Civix Backend Utils
+import asyncio
+import itertools
+import json
+import os
+import queue
+import threading
+from collections import defaultdict
+
+from app.utils.helpers import calculate_distance, get_direction
+from app.utils.spatial import GridIndex
+from app.utils.store import report_store
+
+MAX_SUBSCRIPTION_RADIUS = int(os.getenv('MAX_SUBSCRIPTION_RADIUS', 20000))
+SUBSCRIBER_QUEUE_SIZE = 100
+PUSHED_EVENTS = {'created', 'escalated', 'verified', 'expired', 'deleted'}
+
+
+class Subscription:
+    def __init__(self, subscription_id, lat, lng, radius):
+        self.id = subscription_id
+        self.lat = lat
+        self.lng = lng
+        self.radius = radius
+        self.events = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = 0
+
+    def push(self, payload):
+        try:
+            self.events.put_nowait(payload)
+        except queue.Full:
+            # A stalled client must not hold up the writer
+            self.dropped += 1
+
+
+class LoopSubscription(Subscription):
+    """A subscription read by a coroutine: events go to an asyncio.Queue.
+
+    ``publish`` runs on whichever thread wrote the report, so payloads are
+    handed to the subscriber's event loop rather than put directly.
+    """
+
+    def __init__(self, subscription_id, lat, lng, radius, loop):
+        super().__init__(subscription_id, lat, lng, radius)
+        self.loop = loop
+        self.events = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def push(self, payload):
+        try:
+            self.loop.call_soon_threadsafe(self._put, payload)
+        except RuntimeError:
+            # Loop already closed; the subscriber is going away
+            self.dropped += 1
+
+    def _put(self, payload):
+        try:
+            self.events.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+
+class SubscriptionHub:
+    """Fans report events out to subscribers whose area contains them.
+
+    Each subscription is registered in every grid cell its circle touches,
+    so publishing a report only looks at subscribers in that report's cell
+    instead of every open connection.
+    """
+
+    def __init__(self):
+        self._grid = GridIndex()
+        self._cells = defaultdict(set)
+        self._subscriptions = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def subscribe(self, lat, lng, radius, loop=None):
+        """Register a subscription; with ``loop`` its events arrive on an asyncio.Queue"""
+        radius = min(radius, MAX_SUBSCRIPTION_RADIUS)
+        if loop is None:
+            subscription = Subscription(next(self._ids), lat, lng, radius)
+        else:
+            subscription = LoopSubscription(next(self._ids), lat, lng, radius, loop)
+        with self._lock:
+            self._subscriptions[subscription.id] = subscription
+            for cell in self._grid.cells_in_radius(lat, lng, radius):
+                self._cells[cell].add(subscription.id)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if self._subscriptions.pop(subscription.id, None) is None:
+                return
+            for cell in self._grid.cells_in_radius(subscription.lat, subscription.lng, subscription.radius):
+                members = self._cells.get(cell)
+                if members is not None:
+                    members.discard(subscription.id)
+                    if not members:
+                        del self._cells[cell]
+
+    def publish(self, event, report):
+        if event not in PUSHED_EVENTS:
+            return
+        lat, lng = report['latitude'], report['longitude']
+        with self._lock:
+            members = [self._subscriptions[i] for i in self._cells.get(self._grid.cell(lat, lng), ())]
+        for subscription in members:
+            distance = calculate_distance(subscription.lat, subscription.lng, lat, lng)
+            if distance > subscription.radius:
+                continue
+            payload = {
+                'event': event,
+                'id': report['id'],
+                'latitude': lat,
+                'longitude': lng,
+                'severity': report['severity'],
+                'expiresAt': report['expiresAt'],
+                'distance': int(distance),
+                'direction': get_direction(subscription.lat, subscription.lng, lat, lng)
+            }
+            subscription.push(payload)
+
+
+def format_sse(data, event=None, event_id=None):
+    """Encode one Server-Sent Events message"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+hazard_hub = SubscriptionHub()
+report_store.subscribe(hazard_hub.publish)
@@ -0,0 +1,138 @@
+# Civix Backend Utils
+import hashlib
+import json
+import math
+import os
+
+from app.utils.cache import TTLCache
+from app.utils.geometry import LocalProjection, SegmentGrid, METERS_PER_DEGREE, ROUTE_HAZARD_THRESHOLD
+from app.utils.metrics import timed
+from app.utils.store import report_store
+
+SEVERITY_WEIGHTS = {'LOW': 1.0, 'MEDIUM': 2.0, 'HIGH': 4.0}
+DEPTH_WEIGHTS = {'ANKLE': 0.75, 'KNEE': 1.0, 'TYRE': 1.5, 'UNKNOWN': 1.0}
+VOTE_SCALE = 5  # net votes for an unverified report to approach full confidence
+# Seconds of extra travel time a route is charged per unit of hazard cost
+HAZARD_PENALTY = float(os.getenv('ROUTE_HAZARD_PENALTY', 300))
+
+
+def confidence(report):
+    """How much to trust a report, from 0.2 (heavily downvoted) to 1.0 (verified)"""
+    if report.get('verifiedAt'):
+        return 1.0
+    return 0.6 + 0.4 * math.tanh(report.get('votes', 0) / VOTE_SCALE)
+
+
+def hazard_cost(report, distance, threshold=ROUTE_HAZARD_THRESHOLD):
+    """Weighted cost of passing a report at distance meters from the route.
+
+    Severity and depth set the base weight, confidence scales it, and the
+    cost halves linearly from on-route to ``threshold`` away.
+    """
+    weight = SEVERITY_WEIGHTS.get(report.get('severity'), SEVERITY_WEIGHTS['MEDIUM'])
+    weight *= DEPTH_WEIGHTS.get(report.get('depth'), 1.0)
+    proximity = 1 - 0.5 * min(distance / threshold, 1.0)
+    return weight * confidence(report) * proximity
+
+
+def geometry_hash(geometry):
+    coordinates = json.dumps(geometry['coordinates'], separators=(',', ':'))
+    return hashlib.sha1(coordinates.encode()).hexdigest()
+
+
+class RouteScorer:
+    """Scores route geometries against the live hazard set.
+
+    Only reports inside a route's bounding box are fetched (through the
+    store's grid index) and measured against its segments. Results are
+    memoized per (geometry hash, store version): any report write bumps the
+    version, so a cached score is reused only while the hazards it saw are
+    unchanged.
+    """
+
+    def __init__(self, reports=report_store, threshold=ROUTE_HAZARD_THRESHOLD):
+        self.reports = reports
+        self.threshold = threshold
+        self.cache = TTLCache('route_scores', maxsize=int(os.getenv('ROUTE_SCORE_CACHE_SIZE', 1024)),
+                              ttl=int(os.getenv('ROUTE_SCORE_CACHE_TTL', 300)))
+
+    def score(self, geometry):
+        key = (geometry_hash(geometry), self.reports.current_version())
+        return self.cache.get_or_load(key, lambda: self._score(geometry['coordinates']))
+
+    def score_all(self, geometries):
+        return [self.score(geometry) for geometry in geometries]
+
+    def _candidates(self, coordinates):
+        lngs = [c[0] for c in coordinates]
+        lats = [c[1] for c in coordinates]
+        dlat = self.threshold / METERS_PER_DEGREE
+        dlng = self.threshold / (METERS_PER_DEGREE * max(math.cos(math.radians(max(map(abs, lats)))), 0.01))
+        return self.reports.within_bounds(min(lats) - dlat, min(lngs) - dlng, max(lats) + dlat, max(lngs) + dlng)
+
+    @timed('route_scoring')
+    def _score(self, coordinates):
+        result = {'hazardCount': 0, 'hazardIds': [], 'nearestHazardDistance': None,
+                  'hazardCost': 0.0, 'hazardSegments': []}
+        if not coordinates:
+            return result
+        candidates = self._candidates(coordinates)
+        if not candidates:
+            return result
+
+        project = LocalProjection(sum(c[1] for c in coordinates) / len(coordinates))
+        points = [project(c[0], c[1]) for c in coordinates]
+        if len(points) == 1:
+            points = points * 2
+        grid = SegmentGrid(points, self.threshold)
+
+        matched = []
+        for report in candidates:
+            found = grid.nearest_segment(*project(report['longitude'], report['latitude']))
+            if found is not None and found[0] <= self.threshold:
+                matched.append((found[0], found[1], report))
+        if not matched:
+            return result
+        matched.sort(key=lambda m: m[0])
+
+        segments = {}
+        for distance, index, report in matched:
+            cost = hazard_cost(report, distance, self.threshold)
+            segment = segments.get(index)
+            if segment is None:
+                segment = segments[index] = {
+                    'segmentIndex': index,
+                    'start': coordinates[index],
+                    'end': coordinates[min(index + 1, len(coordinates) - 1)],
+                    'cost': 0.0,
+                    'hazards': []
+                }
+            segment['cost'] += cost
+            segment['hazards'].append({
+                'id': report['id'],
+                'severity': report.get('severity'),
+                'depth': report.get('depth'),
+                'distance': int(distance),
+                'confidence': round(confidence(report), 2),
+                'cost': round(cost, 2)
+            })
+            result['hazardCost'] += cost
+
+        for segment in segments.values():
+            segment['cost'] = round(segment['cost'], 2)
+        result.update({
+            'hazardCount': len(matched),
+            'hazardIds': [report['id'] for _, _, report in matched],
+            'nearestHazardDistance': int(matched[0][0]),
+            'hazardCost': round(result['hazardCost'], 2),
+            'hazardSegments': sorted(segments.values(), key=lambda s: s['segmentIndex'])
+        })
+        return result
+
+
+def route_rank(duration, cost):
+    """Ranking key: travel time plus the hazard penalty, in seconds"""
+    return duration + HAZARD_PENALTY * cost
+
+
+route_scorer = RouteScorer()
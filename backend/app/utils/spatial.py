@@ -0,0 +1,146 @@
+# Civix Backend Utils
+import math
+from array import array
+from collections import defaultdict
+
+from app.utils.helpers import calculate_distance
+from app.utils.metrics import timed
+
+METERS_PER_DEGREE = 111320
+DEFAULT_CELL_SIZE = 0.01  # degrees, roughly 1.1 km of latitude
+
+
+class GridIndex:
+    """Uniform lat/lng grid of point ids for radius queries.
+
+    Points are bucketed into square cells of ``cell_size`` degrees. A radius
+    query visits only the cells overlapping the query's bounding box and runs
+    exact haversine on the points found there.
+
+    Coordinates live in ``array`` columns addressed by row, and buckets hold
+    only ids, so a point costs two packed doubles rather than a tuple of
+    float objects. Removing a point moves the last row into its slot.
+    """
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self._cells = defaultdict(dict)
+        self._rows = {}
+        self.ids = []
+        self.lat = array('d')
+        self.lng = array('d')
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, point_id):
+        return point_id in self._rows
+
+    def cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def _columns(self):
+        """Every per-row sequence, kept aligned by insert and remove"""
+        return [self.ids, self.lat, self.lng]
+
+    def _append_row(self):
+        """Extend subclass columns when insert adds a row"""
+
+    def insert(self, point_id, lat, lng):
+        """Add or move a point; returns its row"""
+        row = self._rows.get(point_id)
+        if row is None:
+            row = self._rows[point_id] = len(self.ids)
+            self.ids.append(point_id)
+            self.lat.append(lat)
+            self.lng.append(lng)
+            self._append_row()
+        else:
+            old_cell = self.cell(self.lat[row], self.lng[row])
+            self.lat[row] = lat
+            self.lng[row] = lng
+            if old_cell == self.cell(lat, lng):
+                return row
+            self._discard(old_cell, point_id)
+        self._cells[self.cell(lat, lng)][point_id] = None
+        return row
+
+    def _discard(self, cell, point_id):
+        bucket = self._cells[cell]
+        bucket.pop(point_id, None)
+        if not bucket:
+            del self._cells[cell]
+
+    def remove(self, point_id):
+        row = self._rows.pop(point_id, None)
+        if row is None:
+            return
+        self._discard(self.cell(self.lat[row], self.lng[row]), point_id)
+        last = len(self.ids) - 1
+        columns = self._columns()
+        if row != last:
+            for column in columns:
+                column[row] = column[last]
+            self._rows[self.ids[row]] = row
+        for column in columns:
+            column.pop()
+
+    def row(self, point_id):
+        return self._rows.get(point_id)
+
+    def cell_range(self, lat, lng, radius):
+        """Return (min_row, min_col, max_row, max_col) of the cells a radius overlaps"""
+        dlat = radius / METERS_PER_DEGREE
+        dlng = radius / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        min_row, min_col = self.cell(lat - dlat, lng - dlng)
+        max_row, max_col = self.cell(lat + dlat, lng + dlng)
+        return min_row, min_col, max_row, max_col
+
+    def cells_in_radius(self, lat, lng, radius):
+        """Return the cell keys overlapping the bounding box of a radius"""
+        min_row, min_col, max_row, max_col = self.cell_range(lat, lng, radius)
+        return [(row, col)
+                for row in range(min_row, max_row + 1)
+                for col in range(min_col, max_col + 1)]
+
+    def _buckets(self, min_row, min_col, max_row, max_col):
+        """Buckets of the occupied cells in a cell range.
+
+        The range is sized arithmetically; when it spans more cells than are
+        occupied the occupied cells are walked instead, so a huge query box
+        costs no more than a full scan.
+        """
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self._cells):
+            return [bucket for (row, col), bucket in self._cells.items()
+                    if min_row <= row <= max_row and min_col <= col <= max_col]
+        return [self._cells[(row, col)]
+                for row in range(min_row, max_row + 1)
+                for col in range(min_col, max_col + 1)
+                if (row, col) in self._cells]
+
+    def candidates(self, lat, lng, radius):
+        """Yield (id, lat, lng) for points in cells overlapping the radius"""
+        rows, lats, lngs = self._rows, self.lat, self.lng
+        for bucket in self._buckets(*self.cell_range(lat, lng, radius)):
+            for point_id in bucket:
+                row = rows[point_id]
+                yield point_id, lats[row], lngs[row]
+
+    def in_bounds(self, min_lat, min_lng, max_lat, max_lng):
+        """Yield ids of points inside a lat/lng bounding box"""
+        rows, lats, lngs = self._rows, self.lat, self.lng
+        for bucket in self._buckets(*self.cell(min_lat, min_lng), *self.cell(max_lat, max_lng)):
+            for point_id in bucket:
+                row = rows[point_id]
+                if min_lat <= lats[row] <= max_lat and min_lng <= lngs[row] <= max_lng:
+                    yield point_id
+
+    @timed('radius_query')
+    def query(self, lat, lng, radius):
+        """Return [(id, distance)] for points within radius meters"""
+        results = []
+        for point_id, p_lat, p_lng in self.candidates(lat, lng, radius):
+            distance = calculate_distance(lat, lng, p_lat, p_lng)
+            if distance <= radius:
+                results.append((point_id, distance))
+        return results
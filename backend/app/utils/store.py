@@ -0,0 +1,382 @@
+# Civix Backend Utils
+import atexit
+import heapq
+import os
+import threading
+import time
+from collections import deque, OrderedDict
+
+from app.storage import storage
+from app.utils.helpers import iso_timestamp
+from app.utils.columns import ReportColumns, SEVERITY_CODES
+
+CHANGE_LOG_SIZE = int(os.getenv('STORE_CHANGE_LOG_SIZE', 10000))
+SHARED_SYNC_INTERVAL = float(os.getenv('STORE_SYNC_INTERVAL', 0.25))
+MAX_QUERY_RADIUS = int(os.getenv('MAX_QUERY_RADIUS', 50000))  # meters; larger radii are clamped
+EXPIRED_MEMORY_SIZE = 10000
+COLUMN_FIELDS = {'latitude', 'longitude', 'lastReportedAt'}
+DEDUP_RADIUS = float(os.getenv('DEDUP_RADIUS', 50))  # meters; 0 disables merging
+DEDUP_WINDOW = float(os.getenv('DEDUP_WINDOW_MINUTES', 60)) * 60
+DEPTH_ORDER = {'UNKNOWN': 0, 'ANKLE': 1, 'KNEE': 2, 'TYRE': 3}
+
+
+def reported_timestamp(report):
+    """Epoch seconds of the latest submission folded into a report"""
+    return iso_timestamp(report.get('lastReportedAt') or report['createdAt'])
+
+
+def merge_fields(canonical, report):
+    """Fields to set on a canonical hazard when ``report`` duplicates it"""
+    reporters = canonical.get('reporters') or [canonical.get('userId')]
+    fields = {'lastReportedAt': report['createdAt']}
+    if report['expiresAt'] > canonical['expiresAt']:
+        fields['expiresAt'] = report['expiresAt']
+    if report.get('userId') not in reporters:
+        fields['reporters'] = reporters + [report.get('userId')]
+        fields['reporterCount'] = len(fields['reporters'])
+    if SEVERITY_CODES.get(report['severity'], -1) > SEVERITY_CODES.get(canonical['severity'], -1):
+        fields['severity'] = report['severity']
+    if DEPTH_ORDER.get(report.get('depth'), 0) > DEPTH_ORDER.get(canonical.get('depth'), 0):
+        fields['depth'] = report['depth']
+    if report.get('photoUrl') and not canonical.get('photoUrl'):
+        fields['photoUrl'] = report['photoUrl']
+    if report.get('description') and not canonical.get('description'):
+        fields['description'] = report['description']
+    return fields
+
+
+class ReportStore:
+    """In-memory report store persisted through a storage backend.
+
+    Reports live in a dict keyed by id and are loaded from the backend once;
+    every write is passed on to the backend. With a shared backend the store
+    also polls for writes made by other worker processes and applies them
+    locally, so every worker serves the same data.
+
+    A ``ReportColumns`` grid over report coordinates is kept in step with
+    every write so radius queries only visit nearby cells; it also holds
+    each report's expiry and last-reported time as packed columns.
+
+    Each write also bumps ``version`` and lands in a bounded change log that
+    backs delta sync. Versions start from the load time in milliseconds so
+    cursors handed out before a restart are never mistaken for new ones.
+    With a shared backend the version is the backend's change sequence
+    instead, so every worker hands out and understands the same cursors;
+    local writes join the log when the next sync reads their sequence.
+
+    Expiry times are parsed once into epoch seconds and kept in a min-heap.
+    Reads pop whatever has come due, so handlers never see an expired report
+    and never parse timestamps. Re-keying (``verify`` extending
+    ``expiresAt``) pushes a fresh heap entry; stale ones are skipped when
+    popped.
+    """
+
+    def __init__(self, backend=storage):
+        self.backend = backend
+        self._reports = {}
+        self._index = ReportColumns()
+        self._lock = threading.RLock()
+        self._loaded = False
+        self.version = 0
+        self._changes = deque(maxlen=CHANGE_LOG_SIZE)
+        self._log_floor = 0
+        self._listeners = []
+        self._expiry_heap = []
+        self._recently_expired = OrderedDict()
+        self._backend_cursor = None
+        self._next_sync = 0
+        self._unlogged = {}
+
+    def load(self):
+        """Load every report from the backend (idempotent)"""
+        with self._lock:
+            if self._loaded:
+                return
+            self._backend_cursor, _ = self.backend.report_changes(None)
+            for report in self.backend.load_reports():
+                self._put(report)
+                self._notify('loaded', report)
+            if self.backend.shared:
+                self.version = self._log_floor = self._backend_cursor
+            else:
+                self.version = self._log_floor = int(time.time() * 1000)
+            self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def _sync(self):
+        """Load on first use, evict expired and pull other workers' writes"""
+        if not self._loaded:
+            self.load()
+        if self._expiry_heap and self._expiry_heap[0][0] <= time.time():
+            self.prune_expired()
+        if self.backend.shared and time.monotonic() >= self._next_sync:
+            self._pull_changes()
+
+    def _pull_changes(self):
+        """Log every backend write since the last pull, applying other workers' ones"""
+        with self._lock:
+            self._next_sync = time.monotonic() + SHARED_SYNC_INTERVAL
+            self._backend_cursor, changes = self.backend.report_changes(self._backend_cursor)
+            for seq, report_id, remote in changes:
+                op = self._unlogged.pop(report_id, None)
+                if not remote:
+                    self._log(seq, op or ('updated' if report_id in self._reports else 'removed'), report_id)
+                    continue
+                report = self.backend.get_report(report_id)
+                if report is None:
+                    removed = self._remove(report_id)
+                    if removed is not None:
+                        self._notify('deleted', removed)
+                    op = 'removed'
+                elif report_id in self._reports:
+                    self._update(report_id, report)
+                    self._notify('updated', self._reports[report_id])
+                    op = 'updated'
+                else:
+                    self._put(report)
+                    self._notify('created', report)
+                    op = 'added'
+                self._log(seq, op, report_id)
+
+    def _put(self, report):
+        self._reports[report['id']] = report
+        self._schedule(report)
+
+    def _schedule(self, report):
+        expires = iso_timestamp(report['expiresAt'])
+        self._index.put(report, expires, reported_timestamp(report))
+        heapq.heappush(self._expiry_heap, (expires, report['id']))
+
+    def _update(self, report_id, fields):
+        report = self._reports.get(report_id)
+        if report is None:
+            return None
+        report.update(fields)
+        if 'expiresAt' in fields:
+            self._schedule(report)
+        elif COLUMN_FIELDS.intersection(fields):
+            self._index.put(report, self._index.expires_at(report_id), reported_timestamp(report))
+        return report
+
+    def _remove(self, report_id):
+        self._index.remove(report_id)
+        return self._reports.pop(report_id, None)
+
+    def _record(self, op, report, event):
+        if self.backend.shared:
+            # Logged under its backend sequence by the next pull
+            self._unlogged.setdefault(report['id'], op)
+            self._next_sync = 0
+        else:
+            self._log(self.version + 1, op, report['id'])
+        self._notify(event, report)
+
+    def _log(self, version, op, report_id):
+        self.version = version
+        if len(self._changes) == self._changes.maxlen:
+            self._log_floor = self._changes[0][0]
+        self._changes.append((version, op, report_id))
+
+    def _notify(self, event, report):
+        for listener in self._listeners:
+            listener(event, report)
+
+    def subscribe(self, listener):
+        """Call listener(event, report) after every write.
+
+        Events are ``created``, ``updated`` (or the reason passed to
+        ``update``), ``deleted`` and ``expired``, plus ``loaded`` for each
+        report read from the backend at startup. Listeners run while the
+        store lock is held, so they must not block.
+        """
+        self._listeners.append(listener)
+
+    def close(self):
+        self.backend.close()
+
+    def get(self, report_id):
+        self._sync()
+        return self._reports.get(report_id)
+
+    def all(self):
+        self._sync()
+        with self._lock:
+            return list(self._reports.values())
+
+    def nearby(self, lat, lng, radius):
+        """Return [(report, distance)] for reports within radius meters"""
+        radius = min(radius, MAX_QUERY_RADIUS)
+        self._sync()
+        with self._lock:
+            return [(self._reports[report_id], distance)
+                    for report_id, distance in self._index.query(lat, lng, radius)]
+
+    def nearby_many(self, points):
+        """Run ``nearby`` for each (lat, lng, radius) under one sync and lock"""
+        self._sync()
+        with self._lock:
+            return [[(self._reports[report_id], distance)
+                     for report_id, distance in self._index.query(lat, lng, min(radius, MAX_QUERY_RADIUS))]
+                    for lat, lng, radius in points]
+
+    def within_bounds(self, min_lat, min_lng, max_lat, max_lng):
+        """Return reports inside a lat/lng bounding box"""
+        self._sync()
+        with self._lock:
+            return [self._reports[report_id]
+                    for report_id in self._index.in_bounds(min_lat, min_lng, max_lat, max_lng)]
+
+    def current_version(self):
+        """Return ``version`` after applying pending expiries and remote writes"""
+        self._sync()
+        return self.version
+
+    def changes_since(self, since):
+        """Summarize changes after cursor ``since``.
+
+        Returns a dict with the new ``cursor``, the ``added`` and ``updated``
+        reports and the ``removed`` report ids, all read under one lock so a
+        report cannot expire in between. ``reset`` is true when the cursor
+        is older than the retained log; ``added`` then holds every report.
+        """
+        self._sync()
+        with self._lock:
+            if self.backend.shared and since is not None and since > self.version:
+                # Cursor from a worker that is ahead of this one
+                self._pull_changes()
+            if since is None or since < self._log_floor or since > self.version:
+                return {'cursor': self.version, 'reset': True, 'added': list(self._reports.values()),
+                        'updated': [], 'removed': []}
+            first_op = {}
+            for version, op, report_id in reversed(self._changes):
+                if version <= since:
+                    break
+                first_op[report_id] = op
+            added, updated, removed = [], [], []
+            for report_id, op in first_op.items():
+                report = self._reports.get(report_id)
+                if op == 'added':
+                    if report is not None:
+                        added.append(report)
+                elif report is not None:
+                    updated.append(report)
+                else:
+                    removed.append(report_id)
+            return {'cursor': self.version, 'reset': False, 'added': added, 'updated': updated, 'removed': removed}
+
+    def __len__(self):
+        self._sync()
+        return len(self._reports)
+
+    def add(self, report):
+        self._ensure_loaded()
+        with self._lock:
+            self._put(report)
+            self.backend.put_report(report)
+            self._record('added', report, 'created')
+        return report
+
+    def add_or_merge(self, report, radius=DEDUP_RADIUS, window=DEDUP_WINDOW):
+        """Add a report, or fold it into an active hazard it duplicates.
+
+        The nearest report within ``radius`` meters that was last reported
+        less than ``window`` seconds before this one is the canonical hazard.
+        It gains the new reporter and keeps the worse severity and depth, in a
+        single write and change event (``escalated`` if the severity rose,
+        else ``merged``). Returns (report, merged).
+        """
+        self._sync()
+        with self._lock:
+            canonical = self._find_duplicate(report, radius, window) if radius > 0 else None
+            if canonical is None:
+                report.setdefault('reporters', [report.get('userId')])
+                report.setdefault('reporterCount', len(report['reporters']))
+                self.add(report)
+                return report, False
+            fields = merge_fields(canonical, report)
+            reason = 'escalated' if 'severity' in fields else 'merged'
+            return self.update(canonical['id'], fields, reason=reason), True
+
+    def _find_duplicate(self, report, radius, window):
+        created = iso_timestamp(report['createdAt'])
+        best = None
+        for report_id, distance in self._index.query(report['latitude'], report['longitude'], radius):
+            if created - self._index.reported_at(report_id) <= window and (best is None or distance < best[1]):
+                best = (report_id, distance)
+        return self._reports[best[0]] if best else None
+
+    def update(self, report_id, fields, reason='updated'):
+        self._ensure_loaded()
+        with self._lock:
+            report = self._update(report_id, fields)
+            if report is None:
+                return None
+            self.backend.update_report(report_id, fields)
+            self._record('updated', report, reason)
+            return report
+
+    def increment(self, report_id, field, delta, reason='updated'):
+        """Atomically add delta to a numeric field through the backend"""
+        self._sync()
+        with self._lock:
+            value = self.backend.increment_report(report_id, field, delta)
+            if value is None:
+                return None
+            return self.apply(report_id, {field: value}, reason)
+
+    def apply(self, report_id, fields, reason='updated'):
+        """Update the in-memory copy only, for writes the backend already has"""
+        with self._lock:
+            report = self._update(report_id, fields)
+            if report is not None:
+                self._record('updated', report, reason)
+            return report
+
+    def delete(self, report_id, reason='deleted'):
+        self._ensure_loaded()
+        with self._lock:
+            report = self._remove(report_id)
+            if report is not None:
+                self.backend.delete_report(report_id)
+                self._record('removed', report, reason)
+            return report
+
+    def prune_expired(self, now=None):
+        """Pop due entries off the expiry heap and evict their reports"""
+        self._ensure_loaded()
+        now = time.time() if now is None else now
+        expired = []
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                expires, report_id = heapq.heappop(self._expiry_heap)
+                if self._index.expires_at(report_id) != expires:
+                    # Superseded by a later expiry, or already removed
+                    continue
+                self.delete(report_id, reason='expired')
+                self._recently_expired[report_id] = expires
+                expired.append(report_id)
+            while len(self._recently_expired) > EXPIRED_MEMORY_SIZE:
+                self._recently_expired.popitem(last=False)
+        return expired
+
+    def was_expired(self, report_id):
+        """True if the report was evicted by expiry (for 410 responses)"""
+        return report_id in self._recently_expired
+
+    def start_expiry_scheduler(self, interval=5):
+        """Evict expired reports in the background so events go out on time"""
+        def run():
+            while True:
+                time.sleep(interval)
+                self.prune_expired()
+
+        thread = threading.Thread(target=run, name='report-expiry', daemon=True)
+        thread.start()
+        return thread
+
+
+report_store = ReportStore()
+atexit.register(report_store.close)
@@ -0,0 +1,156 @@
+# Civix Backend Utils
+import itertools
+import math
+import os
+import threading
+
+from app.utils.cache import TTLCache
+from app.utils.columns import SEVERITIES
+from app.utils.store import report_store
+
+TILE_MIN_ZOOM = 0
+TILE_MAX_ZOOM = int(os.getenv('TILE_MAX_ZOOM', 16))
+MAX_REQUEST_ZOOM = 22
+CLUSTER_BITS = 3  # each tile is split into 8 x 8 cluster cells
+MAX_LATITUDE = 85.05112878
+REMOVED_EVENTS = {'deleted', 'expired'}
+
+# Cell aggregate layout: [count, latitude sum, longitude sum, LOW, MEDIUM, HIGH]
+COUNT, LAT_SUM, LNG_SUM = 0, 1, 2
+
+
+def lat_lng_to_tile(lat, lng, zoom):
+    """Return fractional Web Mercator (x, y) tile coordinates"""
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    scale = 1 << zoom
+    x = (lng + 180.0) / 360.0 * scale
+    y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * scale
+    return min(max(x, 0), scale - 1e-9), min(max(y, 0), scale - 1e-9)
+
+
+def tile_bounds(zoom, x, y):
+    """Return (min_lat, min_lng, max_lat, max_lng) of an XYZ tile"""
+    scale = 1 << zoom
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / scale))))
+
+    return lat(y + 1), x / scale * 360.0 - 180.0, lat(y), (x + 1) / scale * 360.0 - 180.0
+
+
+class TilePyramid:
+    """Hazard clusters for every XYZ tile from zoom 0 to ``TILE_MAX_ZOOM``.
+
+    Each tile is divided into 8 x 8 cells and every report is counted in one
+    cell per zoom level, so adding or removing a report touches one cell on
+    each level rather than re-clustering anything. Each touched tile gets a
+    new version, and rendered tiles are cached by (tile, version), so a pan
+    over unchanged tiles is served from the cache. Deeper zooms are served
+    from the finest level's cells.
+    """
+
+    def __init__(self, reports=report_store, max_zoom=TILE_MAX_ZOOM):
+        self.reports = reports
+        self.max_zoom = max_zoom
+        self.cell_zoom = max_zoom + CLUSTER_BITS
+        self._levels = [{} for _ in range(max_zoom + 1)]
+        self._versions = {}
+        self._clock = itertools.count(1)
+        self._contributions = {}
+        self._lock = threading.Lock()
+        self.cache = TTLCache('hazard_tiles', maxsize=int(os.getenv('TILE_CACHE_SIZE', 4096)),
+                              ttl=int(os.getenv('TILE_CACHE_TTL', 3600)))
+        reports.subscribe(self._on_report_event)
+
+    def _on_report_event(self, event, report):
+        new = None
+        if event not in REMOVED_EVENTS:
+            severity = report.get('severity')
+            new = (report['latitude'], report['longitude'],
+                   SEVERITIES.index(severity) if severity in SEVERITIES else 1)
+        with self._lock:
+            old = self._contributions.get(report['id'])
+            if old == new:
+                return
+            if old is not None:
+                self._apply(old, -1)
+                del self._contributions[report['id']]
+            if new is not None:
+                self._apply(new, 1)
+                self._contributions[report['id']] = new
+
+    def _apply(self, contribution, sign):
+        lat, lng, severity = contribution
+        fx, fy = lat_lng_to_tile(lat, lng, self.cell_zoom)
+        cx, cy = int(fx), int(fy)
+        for zoom in range(TILE_MIN_ZOOM, self.max_zoom + 1):
+            shift = self.max_zoom - zoom
+            cell = (cx >> shift, cy >> shift)
+            tile = (cell[0] >> CLUSTER_BITS, cell[1] >> CLUSTER_BITS)
+            cells = self._levels[zoom].setdefault(tile, {})
+            aggregate = cells.get(cell)
+            if aggregate is None:
+                aggregate = cells[cell] = [0, 0.0, 0.0, 0, 0, 0]
+            aggregate[COUNT] += sign
+            aggregate[LAT_SUM] += sign * lat
+            aggregate[LNG_SUM] += sign * lng
+            aggregate[3 + severity] += sign
+            if aggregate[COUNT] <= 0:
+                del cells[cell]
+                if not cells:
+                    # Empty tiles fall back to version 0, which renders as empty
+                    del self._levels[zoom][tile]
+                    self._versions.pop((zoom,) + tile, None)
+                    continue
+            self._versions[(zoom,) + tile] = next(self._clock)
+
+    def tile_version(self, zoom, x, y):
+        self.reports.current_version()
+        level = min(zoom, self.max_zoom)
+        shift = zoom - level
+        return self._versions.get((level, x >> shift, y >> shift), 0)
+
+    def tile(self, zoom, x, y):
+        """Return the clusters in tile (zoom, x, y) with its version"""
+        version = self.tile_version(zoom, x, y)
+        return self.cache.get_or_load((zoom, x, y, version), lambda: self._render(zoom, x, y, version))
+
+    def _render(self, zoom, x, y, version):
+        level = min(zoom, self.max_zoom)
+        shift = zoom - level
+        with self._lock:
+            cells = list(self._levels[level].get((x >> shift, y >> shift), {}).items())
+        if shift:
+            # Keep only the parent's cells that fall inside this deeper tile
+            depth = self.cell_zoom - zoom
+            if depth >= 0:
+                cells = [(c, a) for c, a in cells if (c[0] >> depth, c[1] >> depth) == (x, y)]
+            else:
+                cells = [(c, a) for c, a in cells if c == (x >> -depth, y >> -depth)]
+        clusters = []
+        for _, aggregate in cells:
+            count = aggregate[COUNT]
+            breakdown = dict(zip(SEVERITIES, aggregate[3:]))
+            clusters.append({
+                'latitude': round(aggregate[LAT_SUM] / count, 6),
+                'longitude': round(aggregate[LNG_SUM] / count, 6),
+                'count': count,
+                'maxSeverity': next(s for s in reversed(SEVERITIES) if breakdown[s] > 0),
+                'severity': breakdown
+            })
+        clusters.sort(key=lambda c: -c['count'])
+        return {'z': zoom, 'x': x, 'y': y, 'version': version, 'clusters': clusters}
+
+    def tiles_for_bbox(self, zoom, min_lat, min_lng, max_lat, max_lng, limit=None):
+        """Return the (x, y) tiles at zoom covering a bounding box.
+
+        Returns None, without listing them, when there are more than limit.
+        """
+        x0, y0 = (int(v) for v in lat_lng_to_tile(max_lat, min_lng, zoom))
+        x1, y1 = (int(v) for v in lat_lng_to_tile(min_lat, max_lng, zoom))
+        if limit is not None and (x1 - x0 + 1) * (y1 - y0 + 1) > limit:
+            return None
+        return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+tile_pyramid = TilePyramid()
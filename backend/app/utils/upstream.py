@@ -0,0 +1,211 @@
+# Civix Backend Utils
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.utils.metrics import stage
+
+MAPBOX_API_URL = os.getenv('MAPBOX_API_URL', 'https://api.mapbox.com')
+MAPBOX_TOKEN = os.getenv('MAPBOX_TOKEN', 'pk.eyJ1IjoiYWxwaGFpbnN0aW54IiwiYSI6ImNta3A2N3M2dDBldjEzZXFyeTJzeGRhdzMifQ.C7b81YKX5_cWuVFJNOMkoA')
+
+CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', 3.05))
+READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', 5))
+MAX_RETRIES = int(os.getenv('UPSTREAM_MAX_RETRIES', 2))
+BACKOFF_BASE = float(os.getenv('UPSTREAM_BACKOFF_BASE', 0.1))
+POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', 20))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """An upstream call failed after retries"""
+
+
+class CircuitOpenError(UpstreamError):
+    """The circuit breaker is open and the call was not attempted"""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets one probe through.
+
+    While open every call fails immediately. After ``reset_timeout`` seconds
+    a single half-open probe is allowed; success closes the circuit, failure
+    opens it again. A probe that never reports back (an exception the
+    clients do not count, or a cancelled async call) expires after another
+    ``reset_timeout`` so the next call can probe instead.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state != 'half-open':
+                return False
+            now = time.monotonic()
+            if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+                return False
+            self._probe_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_started = None
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class UpstreamClient:
+    """Pooled keep-alive HTTP client with timeouts, retries and a breaker"""
+
+    def __init__(self, name, base_url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, breaker=None):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _backoff(self, attempt):
+        # Full jitter: sleep a random fraction of the exponential step
+        time.sleep(random.uniform(0, self.backoff_base * (2 ** attempt)))
+
+    def get_json(self, path, params=None):
+        """GET base_url + path and return the decoded JSON body.
+
+        Connection errors, timeouts and 429/5xx responses are retried up to
+        ``max_retries`` times. Other 4xx responses are returned as-is since
+        Mapbox reports problems in the JSON body.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+        with stage(f"upstream_{self.name}"):
+            return self._get_json(f"{self.base_url}{path}", params)
+
+    def _get_json(self, url, params):
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._backoff(attempt - 1)
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except requests.RequestException as e:
+                error = e
+                continue
+            if response.status_code in RETRY_STATUSES:
+                error = UpstreamError(f"{self.name} returned {response.status_code}")
+                continue
+            try:
+                data = response.json()
+            except ValueError as e:
+                error = e
+                continue
+            self.breaker.record_success()
+            return data
+
+        self.breaker.record_failure()
+        raise UpstreamError(f"{self.name} request failed: {error}") from error
+
+    def stats(self):
+        return {'circuit': self.breaker.state, 'consecutiveFailures': self.breaker.failures}
+
+
+class AsyncUpstreamClient:
+    """Non-blocking counterpart of UpstreamClient for the ASGI app.
+
+    Uses the same retry policy and can share a breaker with a sync client,
+    so both serving modes see one circuit per upstream. The httpx client is
+    created on first use, inside the serving event loop.
+    """
+
+    def __init__(self, name, base_url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, breaker=None):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.breaker = breaker or CircuitBreaker()
+        self._client = None
+
+    def _session(self):
+        if self._client is None:
+            limits = httpx.Limits(max_connections=POOL_SIZE * 5, max_keepalive_connections=POOL_SIZE)
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+        return self._client
+
+    async def get_json(self, path, params=None):
+        """Awaitable ``UpstreamClient.get_json``"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+        with stage(f"upstream_{self.name}"):
+            return await self._get_json(f"{self.base_url}{path}", params)
+
+    async def _get_json(self, url, params):
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(random.uniform(0, self.backoff_base * (2 ** (attempt - 1))))
+            try:
+                response = await self._session().get(url, params=params)
+            except httpx.HTTPError as e:
+                error = e
+                continue
+            if response.status_code in RETRY_STATUSES:
+                error = UpstreamError(f"{self.name} returned {response.status_code}")
+                continue
+            try:
+                data = response.json()
+            except ValueError as e:
+                error = e
+                continue
+            self.breaker.record_success()
+            return data
+
+        self.breaker.record_failure()
+        raise UpstreamError(f"{self.name} request failed: {error}") from error
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+mapbox = UpstreamClient('mapbox', MAPBOX_API_URL)
+mapbox_async = AsyncUpstreamClient('mapbox', MAPBOX_API_URL, breaker=mapbox.breaker)
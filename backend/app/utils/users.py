@@ -0,0 +1,152 @@
+# Civix Backend Utils
+import atexit
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from app.utils.store import report_store
+
+FLUSH_INTERVAL = float(os.getenv('USERS_FLUSH_INTERVAL', 2))
+REMOVED_EVENTS = {'deleted', 'expired'}
+
+
+class UserStore:
+    """User records indexed by userId and deviceId, with report counts.
+
+    With a single-process backend every user is held in memory; new users
+    are written to the backend straight away and profile changes are
+    flushed in batches, like votes. With a shared
+    backend lookups go to the backend's indexed columns instead, so a user
+    registered by one worker is visible to all of them.
+
+    The number of active reports per user is kept from report store
+    events, so profiles never scan reports.
+    """
+
+    def __init__(self, backend=None, reports=report_store):
+        self.backend = backend or reports.backend
+        self._by_id = {}
+        self._by_device = {}
+        self._report_owners = {}
+        self._report_counts = Counter()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._dirty = set()
+        self._loaded = False
+        reports.subscribe(self._on_report_event)
+
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            if not self.backend.shared:
+                for user in self.backend.load_users():
+                    self._index(user)
+            self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def _index(self, user):
+        self._by_id[user['userId']] = user
+        self._by_device[user['deviceId']] = user
+
+    def _on_report_event(self, event, report):
+        owner = self._report_owners.pop(report['id'], None)
+        if owner is not None:
+            self._report_counts[owner] -= 1
+            if self._report_counts[owner] <= 0:
+                del self._report_counts[owner]
+        if event not in REMOVED_EVENTS and report.get('userId'):
+            self._report_owners[report['id']] = report['userId']
+            self._report_counts[report['userId']] += 1
+
+    def __len__(self):
+        self._ensure_loaded()
+        if self.backend.shared:
+            return self.backend.count_users()
+        return len(self._by_id)
+
+    def get(self, user_id):
+        self._ensure_loaded()
+        if self.backend.shared:
+            return self.backend.get_user(user_id)
+        return self._by_id.get(user_id)
+
+    def find_by_device(self, device_id):
+        self._ensure_loaded()
+        if self.backend.shared:
+            return self.backend.find_user_by_device(device_id)
+        return self._by_device.get(device_id)
+
+    def report_count(self, user_id):
+        return self._report_counts.get(user_id, 0)
+
+    def register(self, device_id, name='', phone='', fcm_token=''):
+        """Return (user, created), creating the user if the device is new"""
+        self._ensure_loaded()
+        with self._lock:
+            existing = self.find_by_device(device_id)
+            if existing:
+                return existing, False
+            stamp = int(datetime.now().timestamp() * 1000)
+            while self.get(f"user_{stamp}") is not None:
+                # Two registrations in the same millisecond
+                stamp += 1
+            user = {
+                'userId': f"user_{stamp}",
+                'deviceId': device_id,
+                'name': name,
+                'phone': phone,
+                'fcmToken': fcm_token,
+                'createdAt': datetime.now().isoformat()
+            }
+            # Written through before the token is issued, so a crash before
+            # the next flush cannot leave a valid token with no user behind it
+            stored = self.backend.create_user(dict(user))
+            if self.backend.shared:
+                return stored, stored['userId'] == user['userId']
+            self._index(user)
+            return user, True
+
+    def update(self, user_id, fields):
+        """Apply fields to a user; returns the user or None if unknown"""
+        self._ensure_loaded()
+        with self._lock:
+            user = self.get(user_id)
+            if user is None:
+                return None
+            user.update(fields)
+            if self.backend.shared:
+                self.backend.put_user(user)
+            else:
+                self._dirty.add(user_id)
+            return user
+
+    def flush(self):
+        """Send users changed since the last flush to the backend"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return False
+                changed = [dict(self._by_id[user_id]) for user_id in self._dirty]
+                self._dirty = set()
+            self.backend.save_users(changed)
+        return True
+
+    def start_flusher(self, interval=FLUSH_INTERVAL):
+        def run():
+            while True:
+                time.sleep(interval)
+                self.flush()
+
+        thread = threading.Thread(target=run, name='user-flush', daemon=True)
+        thread.start()
+        return thread
+
+
+user_store = UserStore()
+atexit.register(user_store.flush)
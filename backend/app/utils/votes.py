@@ -0,0 +1,118 @@
+# Civix Backend Utils
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+from app.utils.store import report_store
+
+FLUSH_INTERVAL = float(os.getenv('VOTES_FLUSH_INTERVAL', 2))
+
+
+class VoteStore:
+    """Vote ledger keyed by ``"{userId}_{reportId}"`` with per-report indexes.
+
+    Casting a vote writes the vote record and the report's new tally to the
+    backend together (one journal entry, or one transaction with a shared
+    backend), so a crash or a second worker can never count a vote twice.
+    Votes for reports that expire or are deleted are garbage collected, and
+    those removals reach the backend in batches from a background flusher.
+    """
+
+    def __init__(self, reports=report_store):
+        self.reports = reports
+        self.backend = reports.backend
+        self._votes = {}
+        self._by_report = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._removed_reports = []
+        # Filled from store listeners, which must not take our lock
+        self._gc_queue = deque()
+        self._loaded = False
+        reports.subscribe(self._on_report_event)
+
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            for vote in self.backend.load_votes():
+                if self.reports.get(vote['reportId']) is not None:
+                    self._index(vote)
+                else:
+                    self._removed_reports.append(vote['reportId'])
+            self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def _index(self, vote):
+        self._votes[vote['key']] = vote
+        self._by_report.setdefault(vote['reportId'], set()).add(vote['key'])
+
+    def _on_report_event(self, event, report):
+        if event in ('expired', 'deleted'):
+            self._gc_queue.append(report['id'])
+
+    def _collect_garbage(self):
+        while self._gc_queue:
+            report_id = self._gc_queue.popleft()
+            for key in self._by_report.pop(report_id, ()):
+                self._votes.pop(key, None)
+            self._removed_reports.append(report_id)
+
+    def get(self, user_id, report_id):
+        self._ensure_loaded()
+        return self._votes.get(f"{user_id}_{report_id}")
+
+    def __len__(self):
+        return len(self._votes)
+
+    def cast(self, user_id, report_id, vote):
+        """Record a user's vote and adjust the report tally by the difference.
+
+        Returns the updated report, or None if the report does not exist.
+        """
+        self._ensure_loaded()
+        key = f"{user_id}_{report_id}"
+        with self._lock:
+            self._collect_garbage()
+            tally = self.backend.cast_vote(user_id, report_id, vote)
+            report = self.reports.apply(report_id, {'votes': tally}, reason='voted') if tally is not None else None
+            if report is None:
+                return None
+            existing = self._votes.get(key)
+            if existing:
+                existing['vote'] = vote
+            else:
+                self._index({'key': key, 'vote': vote, 'userId': user_id, 'reportId': report_id})
+            return report
+
+    def flush(self):
+        """Drop votes for removed reports from the backend"""
+        with self._flush_lock:
+            with self._lock:
+                self._collect_garbage()
+                if not self._removed_reports:
+                    return False
+                removed = self._removed_reports
+                self._removed_reports = []
+            # Persist outside the ledger lock so voting is not held up
+            self.backend.save_votes([], removed)
+        return True
+
+    def start_flusher(self, interval=FLUSH_INTERVAL):
+        def run():
+            while True:
+                time.sleep(interval)
+                self.flush()
+
+        thread = threading.Thread(target=run, name='vote-flush', daemon=True)
+        thread.start()
+        return thread
+
+
+vote_store = VoteStore()
+atexit.register(vote_store.flush)
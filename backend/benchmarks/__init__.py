@@ -0,0 +1 @@
+# Civix Backend Benchmarks
@@ -0,0 +1,167 @@
+# Civix Backend Benchmarks
+"""Throughput of the sync (WSGI) and async (ASGI) serving modes.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_asgi --latency 0.2 --concurrency 64 --requests 400
+
+The Mapbox stub and each server run as separate processes on a synthetic
+dataset. The sync server has a fixed pool of ``--threads`` request threads,
+as under ``gunicorn --threads``; the async server is ``uvicorn app.asgi:app``.
+The load is a mix of route and place-search requests with unique
+coordinates and queries, so every request waits on the stub.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from benchmarks.datasets import CITY_CENTER, generate, write_dataset
+from benchmarks.load import summarize
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve_sync(port, threads):
+    """Serve the Flask app from a fixed pool of request threads"""
+    from werkzeug.serving import BaseWSGIServer
+    from app.main import app
+
+    class PooledWSGIServer(BaseWSGIServer):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.pool = ThreadPoolExecutor(threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._process, request, client_address)
+
+        def _process(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    PooledWSGIServer('127.0.0.1', port, app).serve_forever()
+
+
+def start_process(args, workdir, env):
+    return subprocess.Popen([sys.executable] + args, cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+async def drive(base_url, requests, concurrency):
+    """Send a route/search mix from ``concurrency`` tasks; returns a summary"""
+    counter = iter(range(requests))
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        async def worker():
+            nonlocal errors
+            for n in counter:
+                # Unique coordinates and queries miss every upstream cache
+                start = time.perf_counter()
+                if n % 2:
+                    response = await client.get('/api/search', params={
+                        'q': f"place {n}", 'lat': CITY_CENTER[0], 'lng': CITY_CENTER[1]})
+                else:
+                    offset = n * 0.0002
+                    response = await client.post('/api/routes', json={
+                        'origin': {'latitude': CITY_CENTER[0] + offset, 'longitude': CITY_CENTER[1]},
+                        'destination': {'latitude': CITY_CENTER[0] + 0.03, 'longitude': CITY_CENTER[1] + offset}})
+                latencies.append(time.perf_counter() - start)
+                errors += response.status_code >= 400
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return summarize(latencies, errors, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.2, help='Mapbox stub latency in seconds')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--threads', type=int, default=8, help='request threads of the sync server')
+    parser.add_argument('--reports', type=int, default=2000)
+    parser.add_argument('--out', help='write results as JSON')
+    parser.add_argument('--serve-sync', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_sync:
+        serve_sync(args.serve_sync, args.threads)
+        return
+
+    base = tempfile.mkdtemp(prefix='civix-asgi-bench-')
+    dataset = generate(args.reports, users=200, votes=2000)
+    stub_port = free_port()
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR, MAPBOX_API_URL=f"http://127.0.0.1:{stub_port}")
+    stub = start_process(['-m', 'benchmarks.mapbox_stub', '--port', str(stub_port),
+                          '--latency', str(args.latency)], BACKEND_DIR, env)
+
+    modes = {
+        f"sync ({args.threads} threads)": lambda port: ['-m', 'benchmarks.bench_asgi', '--serve-sync', str(port),
+                                                        '--threads', str(args.threads)],
+        'asgi (uvicorn)': lambda port: ['-m', 'uvicorn', 'app.asgi:app', '--port', str(port),
+                                        '--log-level', 'warning'],
+    }
+    results = {'latency': args.latency, 'concurrency': args.concurrency, 'modes': {}}
+    try:
+        for name, command in modes.items():
+            workdir = os.path.join(base, name.split()[0])
+            write_dataset(workdir, dataset)
+            port = free_port()
+            server = start_process(command(port), workdir, env)
+            try:
+                wait_ready(f"http://127.0.0.1:{port}/health")
+                results['modes'][name] = asyncio.run(drive(f"http://127.0.0.1:{port}", args.requests, args.concurrency))
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        stub.terminate()
+        stub.wait()
+        shutil.rmtree(base, ignore_errors=True)
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, Mapbox latency {args.latency * 1000:.0f} ms\n")
+    print(f"{'mode':<20} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, summary in results['modes'].items():
+        print(f"{name:<20} {summary['throughput_rps']:>8.1f} {summary['p50_ms']:>9.1f} "
+              f"{summary['p95_ms']:>9.1f} {summary['p99_ms']:>9.1f} {summary['errors']:>7}")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+# Civix Backend Benchmarks
+"""Compare report dicts, __slots__ records and ReportColumns at 100k reports.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_columns
+
+Memory is measured with tracemalloc while building each layout from the
+same report dicts (the dicts themselves are excluded except for the dict
+layout). Latency covers a radius filter and a bounding-box filter.
+"""
+import gc
+import json
+import random
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from app.utils.columns import ReportColumns
+from app.utils.helpers import calculate_distance, iso_timestamp
+
+CENTER = (23.0225, 72.5714)
+SPREAD = 0.15
+COUNT = 100000
+QUERIES = 50
+
+
+class ReportRecord:
+    __slots__ = ('id', 'latitude', 'longitude', 'expires')
+
+    def __init__(self, report):
+        self.id = report['id']
+        self.latitude = report['latitude']
+        self.longitude = report['longitude']
+        self.expires = iso_timestamp(report['expiresAt'])
+
+
+def make_reports(n, rng):
+    now = datetime.now()
+    reports = []
+    for i in range(n):
+        created = now - timedelta(minutes=rng.uniform(0, 300))
+        reports.append({
+            'id': 1700000000000 + i,
+            'latitude': CENTER[0] + rng.uniform(-SPREAD, SPREAD),
+            'longitude': CENTER[1] + rng.uniform(-SPREAD, SPREAD),
+            'severity': rng.choice(['LOW', 'MEDIUM', 'HIGH']),
+            'depth': rng.choice(['ANKLE', 'KNEE', 'TYRE', 'UNKNOWN']),
+            'photoUrl': None,
+            'description': '',
+            'userId': f"user_{rng.randint(1, 5000)}",
+            'votes': rng.randint(-3, 10),
+            'createdAt': created.isoformat(),
+            'expiresAt': (created + timedelta(hours=4)).isoformat()
+        })
+    # Round-trip through JSON so strings are fresh objects, as after a load
+    return json.loads(json.dumps(reports))
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def build_tuple_grid(reports, cell_size=0.01):
+    """The previous GridIndex layout: per-cell dicts of id -> (lat, lng)"""
+    cells = defaultdict(dict)
+    points = {}
+    for r in reports:
+        cell = (int(r['latitude'] // cell_size), int(r['longitude'] // cell_size))
+        cells[cell][r['id']] = (r['latitude'], r['longitude'])
+        points[r['id']] = cell
+    return cells, points
+
+
+def build_columns(reports):
+    columns = ReportColumns()
+    for r in reports:
+        columns.put(r, iso_timestamp(r['expiresAt']), iso_timestamp(r['createdAt']))
+    return columns
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        fn(i)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    rng = random.Random(42)
+    text = json.dumps(make_reports(COUNT, rng))
+    reports, dict_bytes = measure(lambda: json.loads(text))
+    _, record_bytes = measure(lambda: [ReportRecord(r) for r in reports])
+    _, tuple_grid_bytes = measure(lambda: build_tuple_grid(reports))
+    columns, column_bytes = measure(lambda: build_columns(reports))
+
+    print(f"Memory for {COUNT} reports")
+    print(f"  report dicts (full JSON payload)   {dict_bytes / 1e6:8.1f} MB")
+    print(f"  __slots__ records (numeric fields) {record_bytes / 1e6:8.1f} MB")
+    print(f"  tuple grid index (previous)        {tuple_grid_bytes / 1e6:8.1f} MB")
+    print(f"  ReportColumns (grid + columns)     {column_bytes / 1e6:8.1f} MB"
+          f"  ({columns.nbytes() / 1e6:.1f} MB packed)")
+
+    queries = [(CENTER[0] + rng.uniform(-SPREAD, SPREAD), CENTER[1] + rng.uniform(-SPREAD, SPREAD))
+               for _ in range(QUERIES)]
+
+    def dict_radius(i, radius=1000):
+        lat, lng = queries[i]
+        return [r['id'] for r in reports
+                if calculate_distance(lat, lng, r['latitude'], r['longitude']) <= radius]
+
+    def column_radius(i, radius=1000):
+        lat, lng = queries[i]
+        return [point_id for point_id, _ in columns.query(lat, lng, radius)]
+
+    def dict_bbox(i, half=0.02):
+        lat, lng = queries[i]
+        return [r['id'] for r in reports
+                if lat - half <= r['latitude'] <= lat + half and lng - half <= r['longitude'] <= lng + half]
+
+    def column_bbox(i, half=0.02):
+        lat, lng = queries[i]
+        return list(columns.in_bounds(lat - half, lng - half, lat + half, lng + half))
+
+    # Sanity checks: both layouts must agree
+    assert sorted(dict_radius(0)) == sorted(column_radius(0))
+    assert sorted(dict_bbox(0)) == sorted(column_bbox(0))
+
+    rows = [
+        ('radius 1 km', timed(dict_radius, 5), timed(column_radius, QUERIES)),
+        ('bbox 4x4 km', timed(dict_bbox, 5), timed(column_bbox, QUERIES)),
+    ]
+    print(f"\n{'operation':<16} {'dicts ms':>10} {'columns ms':>11} {'speedup':>8}")
+    for name, dict_ms, column_ms in rows:
+        print(f"{name:<16} {dict_ms:>10.3f} {column_ms:>11.3f} {dict_ms / column_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
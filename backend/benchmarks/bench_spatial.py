@@ -0,0 +1,63 @@
+# Civix Backend Benchmarks
+"""Compare GridIndex radius queries against the linear haversine scan.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_spatial
+"""
+import random
+import time
+
+from app.utils.helpers import calculate_distance
+from app.utils.spatial import GridIndex
+
+CENTER = (23.0225, 72.5714)
+SPREAD = 0.15  # degrees, roughly a 33 km box around the city center
+SIZES = [1000, 10000, 100000]
+QUERIES = 200
+RADII = [500, 10000]
+
+
+def make_points(n, rng):
+    return [(i, CENTER[0] + rng.uniform(-SPREAD, SPREAD), CENTER[1] + rng.uniform(-SPREAD, SPREAD))
+            for i in range(n)]
+
+
+def linear_scan(points, lat, lng, radius):
+    results = []
+    for point_id, p_lat, p_lng in points:
+        distance = calculate_distance(lat, lng, p_lat, p_lng)
+        if distance <= radius:
+            results.append((point_id, distance))
+    return results
+
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    for lat, lng, radius in queries:
+        fn(lat, lng, radius)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    rng = random.Random(42)
+    print(f"{'reports':>8} {'radius':>7} {'linear ms':>10} {'grid ms':>9} {'speedup':>8}")
+    for n in SIZES:
+        points = make_points(n, rng)
+        index = GridIndex()
+        for point_id, lat, lng in points:
+            index.insert(point_id, lat, lng)
+        for radius in RADII:
+            queries = [(CENTER[0] + rng.uniform(-SPREAD, SPREAD), CENTER[1] + rng.uniform(-SPREAD, SPREAD), radius)
+                       for _ in range(QUERIES)]
+            # Sanity check: both strategies must agree
+            lat, lng, _ = queries[0]
+            assert sorted(i for i, _ in linear_scan(points, lat, lng, radius)) == \
+                sorted(i for i, _ in index.query(lat, lng, radius))
+            linear_ms = timed(lambda a, b, r: linear_scan(points, a, b, r), queries[:20])
+            grid_ms = timed(index.query, queries)
+            print(f"{n:>8} {radius:>7} {linear_ms:>10.3f} {grid_ms:>9.3f} {linear_ms / grid_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
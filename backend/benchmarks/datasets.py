@@ -0,0 +1,133 @@
+# Civix Backend Benchmarks
+"""Generate synthetic reports.json, votes.json and users.json.
+
+Hazards are drawn from Gaussian clusters around waterlogging hotspots near
+the city center, with a thin uniform background. Creation times are spread
+over the last four hours so expiries fall due steadily, and a share of
+reports are verified (five more hours of life).
+
+    python -m benchmarks.datasets --reports 100000 --users 20000 --votes 300000 --out data/
+"""
+import argparse
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+CITY_CENTER = (23.0225, 72.5714)  # Ahmedabad, the app's default region
+CITY_RADIUS = 0.12  # degrees
+HOTSPOTS = 25
+HOTSPOT_SPREAD = 0.004  # degrees, about 450 m
+BACKGROUND_SHARE = 0.15
+VERIFIED_SHARE = 0.2
+SEVERITY_WEIGHTS = {'LOW': 0.35, 'MEDIUM': 0.4, 'HIGH': 0.25}
+DEPTHS = ['ANKLE', 'KNEE', 'TYRE', 'UNKNOWN']
+
+
+def make_hotspots(rng, count=HOTSPOTS):
+    return [(CITY_CENTER[0] + rng.uniform(-CITY_RADIUS, CITY_RADIUS) * 0.7,
+             CITY_CENTER[1] + rng.uniform(-CITY_RADIUS, CITY_RADIUS) * 0.7,
+             rng.paretovariate(1.5))
+            for _ in range(count)]
+
+
+def make_users(count, rng, now=None):
+    now = now or datetime.now()
+    base = int(now.timestamp() * 1000) - count * 1000
+    return [{
+        'userId': f"user_{base + i * 1000}",
+        'deviceId': f"device_{i:07d}",
+        'name': f"Test User {i}",
+        'phone': '',
+        'fcmToken': '',
+        'createdAt': (now - timedelta(days=rng.uniform(0, 365))).isoformat()
+    } for i in range(count)]
+
+
+def make_reports(count, users, rng, now=None, hotspots=None):
+    now = now or datetime.now()
+    hotspots = hotspots or make_hotspots(rng)
+    weights = [h[2] for h in hotspots]
+    base_id = int(now.timestamp() * 1000) - count * 10
+    severities = list(SEVERITY_WEIGHTS)
+    reports = []
+    for i in range(count):
+        if rng.random() < BACKGROUND_SHARE:
+            lat = CITY_CENTER[0] + rng.uniform(-CITY_RADIUS, CITY_RADIUS)
+            lng = CITY_CENTER[1] + rng.uniform(-CITY_RADIUS, CITY_RADIUS)
+        else:
+            h_lat, h_lng, _ = rng.choices(hotspots, weights)[0]
+            lat = rng.gauss(h_lat, HOTSPOT_SPREAD)
+            lng = rng.gauss(h_lng, HOTSPOT_SPREAD)
+        created = now - timedelta(seconds=rng.uniform(0, 4 * 3600 - 60))
+        report = {
+            'id': base_id + i * 10,
+            'latitude': round(lat, 6),
+            'longitude': round(lng, 6),
+            'severity': rng.choices(severities, SEVERITY_WEIGHTS.values())[0],
+            'depth': rng.choice(DEPTHS),
+            'photoUrl': None,
+            'description': '',
+            'userId': rng.choice(users)['userId'] if users else None,
+            'votes': 0,
+            'createdAt': created.isoformat(),
+            'expiresAt': (created + timedelta(hours=4)).isoformat()
+        }
+        if rng.random() < VERIFIED_SHARE:
+            verified = created + timedelta(seconds=rng.uniform(0, (now - created).total_seconds()))
+            report['verifiedAt'] = verified.isoformat()
+            report['expiresAt'] = (verified + timedelta(hours=5)).isoformat()
+        reports.append(report)
+    return reports
+
+
+def make_votes(count, reports, users, rng):
+    """Up/down votes from distinct (user, report) pairs; tallies are applied to reports"""
+    votes = {}
+    by_id = {r['id']: r for r in reports}
+    attempts = 0
+    while len(votes) < count and attempts < count * 3:
+        attempts += 1
+        report = rng.choice(reports)
+        user = rng.choice(users)
+        key = f"{user['userId']}_{report['id']}"
+        if key in votes:
+            continue
+        vote = 1 if rng.random() < 0.8 else -1
+        votes[key] = {'key': key, 'userId': user['userId'], 'reportId': report['id'], 'vote': vote}
+        by_id[report['id']]['votes'] += vote
+    return list(votes.values())
+
+
+def generate(reports=10000, users=2000, votes=30000, seed=42):
+    rng = random.Random(seed)
+    now = datetime.now()
+    user_list = make_users(users, rng, now)
+    report_list = make_reports(reports, user_list, rng, now)
+    vote_list = make_votes(votes, report_list, user_list, rng) if user_list and report_list else []
+    return {'reports': report_list, 'votes': vote_list, 'users': user_list}
+
+
+def write_dataset(directory, dataset):
+    os.makedirs(directory, exist_ok=True)
+    for name in ('reports', 'votes', 'users'):
+        with open(os.path.join(directory, f"{name}.json"), 'w') as f:
+            json.dump(dataset[name], f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reports', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--votes', type=int, default=30000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='.', help='directory to write the JSON files to')
+    args = parser.parse_args()
+    dataset = generate(args.reports, args.users, args.votes, args.seed)
+    write_dataset(args.out, dataset)
+    print(f"Wrote {len(dataset['reports'])} reports, {len(dataset['votes'])} votes "
+          f"and {len(dataset['users'])} users to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# Civix Backend Benchmarks
+"""End-to-end load driver over the Flask test client.
+
+Worker threads draw requests from a weighted endpoint mix (nearby reports,
+alert checks, routes against the Mapbox stub, stats, tiles, new reports and
+votes) and record per-endpoint latency. Imported by ``benchmarks.run``.
+"""
+import random
+import threading
+import time
+
+from app.utils.auth import generate_token
+from app.utils.tiles import lat_lng_to_tile
+from benchmarks.datasets import CITY_CENTER, CITY_RADIUS
+
+ENDPOINT_MIX = {
+    'GET /api/reports': 30,
+    'POST /api/alerts/check': 25,
+    'POST /api/routes': 10,
+    'GET /api/stats': 10,
+    'GET /api/reports/tiles': 10,
+    'POST /api/reports': 5,
+    'POST /api/reports/<id>/vote': 10,
+}
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {'requests': 0, 'errors': errors}
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3)
+    }
+
+
+class LoadDriver:
+    def __init__(self, app, users, report_ids, seed=11):
+        self.app = app
+        self.tokens = [generate_token(u['userId']) for u in users[:200]]
+        self.report_ids = report_ids
+        self.seed = seed
+        self.names = list(ENDPOINT_MIX)
+        self.weights = list(ENDPOINT_MIX.values())
+
+    def _point(self, rng):
+        return (CITY_CENTER[0] + rng.uniform(-CITY_RADIUS, CITY_RADIUS),
+                CITY_CENTER[1] + rng.uniform(-CITY_RADIUS, CITY_RADIUS))
+
+    def _request(self, client, name, rng):
+        lat, lng = self._point(rng)
+        auth = {'Authorization': f"Bearer {rng.choice(self.tokens)}"}
+        if name == 'GET /api/reports':
+            return client.get('/api/reports', query_string={'lat': lat, 'lng': lng, 'radius': 2000})
+        if name == 'POST /api/alerts/check':
+            return client.post('/api/alerts/check', json={'latitude': lat, 'longitude': lng, 'radius': 500})
+        if name == 'POST /api/routes':
+            d_lat, d_lng = self._point(rng)
+            return client.post('/api/routes', json={
+                'origin': {'latitude': lat, 'longitude': lng},
+                'destination': {'latitude': d_lat, 'longitude': d_lng}})
+        if name == 'GET /api/stats':
+            return client.get('/api/stats')
+        if name == 'GET /api/reports/tiles':
+            z = rng.randint(10, 15)
+            x, y = (int(v) for v in lat_lng_to_tile(lat, lng, z))
+            return client.get(f"/api/reports/tiles/{z}/{x}/{y}")
+        if name == 'POST /api/reports':
+            return client.post('/api/reports', headers=auth, json={
+                'latitude': lat, 'longitude': lng,
+                'severity': rng.choice(['LOW', 'MEDIUM', 'HIGH']), 'depth': 'KNEE'})
+        report_id = rng.choice(self.report_ids)
+        return client.post(f"/api/reports/{report_id}/vote", headers=auth,
+                           json={'vote': rng.choice([1, 1, 1, -1])})
+
+    def run(self, requests=2000, concurrency=8):
+        """Send ``requests`` requests from ``concurrency`` threads; returns a summary"""
+        latencies = {name: [] for name in self.names}
+        errors = {name: 0 for name in self.names}
+        lock = threading.Lock()
+        def worker(n):
+            rng = random.Random(self.seed + n)
+            client = self.app.test_client()
+            local = []
+            # The first requests % concurrency workers send one extra
+            for _ in range(requests // concurrency + (n < requests % concurrency)):
+                name = rng.choices(self.names, self.weights)[0]
+                start = time.perf_counter()
+                response = self._request(client, name, rng)
+                local.append((name, time.perf_counter() - start, response.status_code >= 400))
+            with lock:
+                for name, latency, failed in local:
+                    latencies[name].append(latency)
+                    errors[name] += failed
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        everything = [latency for samples in latencies.values() for latency in samples]
+        return {
+            'concurrency': concurrency,
+            'elapsed_s': round(elapsed, 3),
+            'overall': summarize(everything, sum(errors.values()), elapsed),
+            'endpoints': {name: summarize(latencies[name], errors[name], elapsed) for name in self.names}
+        }
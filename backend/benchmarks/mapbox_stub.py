@@ -0,0 +1,116 @@
+# Civix Backend Benchmarks
+"""Local stand-in for the Mapbox directions and geocoding APIs.
+
+Point the backend at it with ``MAPBOX_API_URL=http://127.0.0.1:8900`` to
+exercise timeouts, retries and the circuit breaker without network access:
+
+    python -m benchmarks.mapbox_stub --latency 0.2 --fail-rate 0.3
+
+``start_stub()`` runs the same server on a background thread for scripts.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+
+class StubConfig:
+    def __init__(self, latency=0.0, fail_rate=0.0, fail_status=503, seed=None):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.requests = 0
+        self._rng = random.Random(seed)
+
+    def should_fail(self):
+        return self._rng.random() < self.fail_rate
+
+
+def directions_payload(coords, alternatives=3, vertices=400):
+    """Build a Mapbox-shaped directions response between two points"""
+    (o_lng, o_lat), (d_lng, d_lat) = [map(float, c.split(',')) for c in coords.split(';')]
+    routes = []
+    for alt in range(alternatives):
+        bend = (alt - 1) * 0.01
+        coordinates = []
+        for i in range(vertices):
+            t = i / (vertices - 1)
+            coordinates.append([o_lng + (d_lng - o_lng) * t + bend * t * (1 - t),
+                                o_lat + (d_lat - o_lat) * t - bend * t * (1 - t)])
+        routes.append({
+            'distance': 5000 + alt * 400,
+            'duration': 900 + alt * 60,
+            'geometry': {'type': 'LineString', 'coordinates': coordinates},
+            'legs': [{'steps': [{'maneuver': {'instruction': f'Step {n}'}} for n in range(12)]}]
+        })
+    return {'code': 'Ok', 'routes': routes}
+
+
+def places_payload(query):
+    return {'features': [{
+        'text': f"{query.title()} {n}",
+        'place_name': f"{query.title()} {n}, Ahmedabad, Gujarat, India",
+        'center': [72.5714 + n * 0.01, 23.0225 + n * 0.01],
+        'place_type': ['locality']
+    } for n in range(5)]}
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            config.requests += 1
+            if config.latency:
+                time.sleep(config.latency)
+            if config.should_fail():
+                self._send(config.fail_status, {'message': 'stub failure'})
+                return
+            path = unquote(urlsplit(self.path).path)
+            if path.startswith('/directions/v5/mapbox/'):
+                self._send(200, directions_payload(path.rsplit('/', 1)[-1]))
+            elif path.startswith('/geocoding/v5/mapbox.places/'):
+                self._send(200, places_payload(path.rsplit('/', 1)[-1][:-len('.json')]))
+            else:
+                self._send(404, {'message': 'Not Found'})
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start_stub(host='127.0.0.1', port=0, **config_kwargs):
+    """Start the stub on a daemon thread; returns (server, config, base_url)"""
+    config = StubConfig(**config_kwargs)
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, config, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of requests that fail')
+    parser.add_argument('--fail-status', type=int, default=503)
+    args = parser.parse_args()
+    config = StubConfig(args.latency, args.fail_rate, args.fail_status)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config))
+    print(f"Mapbox stub listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# Civix Backend Benchmarks
+"""Micro-benchmarks of hot helpers against a loaded dataset.
+
+Imported by ``benchmarks.run`` after it has switched into the dataset
+directory; the app modules load their data from the working directory.
+"""
+import os
+import random
+import statistics
+import time
+
+from app.storage.json_backend import JsonBackend, write_json_atomic
+from app.utils.helpers import calculate_distance, load_json_file, save_json_file
+from app.utils.scoring import route_scorer
+from benchmarks.datasets import CITY_CENTER, CITY_RADIUS
+from benchmarks.mapbox_stub import directions_payload
+
+
+def measure(fn, repeat, batch=1, warmup=1):
+    """Time ``repeat`` calls of fn(i), each running ``batch`` operations"""
+    for i in range(warmup):
+        fn(i)
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) / batch)
+    samples.sort()
+    return {
+        'runs': repeat * batch,
+        'mean_us': round(statistics.fmean(samples) * 1e6, 3),
+        'p50_us': round(samples[len(samples) // 2] * 1e6, 3),
+        'p95_us': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1e6, 3),
+        'ops_per_sec': round(1 / statistics.fmean(samples), 1)
+    }
+
+
+def random_point(rng):
+    return (CITY_CENTER[0] + rng.uniform(-CITY_RADIUS, CITY_RADIUS),
+            CITY_CENTER[1] + rng.uniform(-CITY_RADIUS, CITY_RADIUS))
+
+
+def bench_calculate_distance(rng, repeat=200, batch=1000):
+    pairs = [random_point(rng) + random_point(rng) for _ in range(batch)]
+
+    def run(i):
+        for lat1, lng1, lat2, lng2 in pairs:
+            calculate_distance(lat1, lng1, lat2, lng2)
+    return measure(run, repeat, batch)
+
+
+def bench_route_scorer(rng, repeat=30, alternatives=3):
+    """route_scorer.score_all on stub routes crossing the city, as the /routes handler calls it.
+
+    Every run scores fresh geometries, so the score cache never hits.
+    """
+    batches = []
+    for _ in range(repeat):
+        (o_lat, o_lng), (d_lat, d_lng) = random_point(rng), random_point(rng)
+        routes = directions_payload(f"{o_lng},{o_lat};{d_lng},{d_lat}", alternatives=alternatives)['routes']
+        batches.append([route['geometry'] for route in routes])
+    return measure(lambda i: route_scorer.score_all(batches[i]), repeat, warmup=0)
+
+
+def bench_get_stats(client, repeat=200):
+    def run(i):
+        response = client.get('/api/stats')
+        assert response.status_code == 200
+    return measure(run, repeat)
+
+
+def bench_storage(workdir, repeat=5):
+    """JSON helpers and the JSON backend on a copy of the dataset files"""
+    reports = load_json_file('reports.json')
+    votes = load_json_file('votes.json')
+    path = os.path.join(workdir, 'bench_reports.json')
+    results = {
+        'load_json_file': measure(lambda i: load_json_file('reports.json'), repeat),
+        'save_json_file': measure(lambda i: save_json_file(path, reports), repeat),
+        'write_json_atomic': measure(lambda i: write_json_atomic(path, reports), repeat),
+    }
+    write_json_atomic(path, reports)
+    backend = JsonBackend(reports_file=path, votes_file=os.path.join(workdir, 'bench_votes.json'),
+                          users_file=os.path.join(workdir, 'bench_users.json'))
+    results['backend_load_reports'] = measure(lambda i: backend.load_reports(), repeat)
+    ids = [r['id'] for r in reports]
+    results['backend_increment_report'] = measure(
+        lambda i: backend.increment_report(ids[i % len(ids)], 'votes', 1), 200, warmup=0)
+    results['backend_save_votes'] = measure(lambda i: backend.save_votes(votes, []), repeat)
+    backend.close()
+    return results
+
+
+def run_all(client, workdir, seed=7):
+    rng = random.Random(seed)
+    results = {
+        'calculate_distance': bench_calculate_distance(rng),
+        'route_scorer_score_all': bench_route_scorer(rng),
+        'get_stats': bench_get_stats(client),
+    }
+    for name, result in bench_storage(workdir).items():
+        results[f"storage_{name}"] = result
+    return results
@@ -0,0 +1,127 @@
+# Civix Backend Benchmarks
+"""Benchmark harness: synthetic dataset, micro-benchmarks and a load run.
+
+Run from the backend directory:
+
+    python -m benchmarks.run --reports 10000 --requests 2000 --out bench-results.json
+
+A dataset is generated into a temporary directory (or ``--data``), the app
+is imported from there with Mapbox pointed at the local stub, and results
+are written as JSON. Each entry in ``--thresholds`` names a dotted path into
+the results with a ``max`` (or ``min``) bound; the exit status is 1 if any
+bound is broken, so the run can gate CI.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.datasets import generate, write_dataset
+from benchmarks.mapbox_stub import start_stub
+
+DEFAULT_THRESHOLDS = os.path.join(os.path.dirname(__file__), 'thresholds.json')
+
+
+def lookup(results, path):
+    value = results
+    for key in path.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def check_thresholds(results, thresholds):
+    """Return one check per threshold; missing metrics fail"""
+    checks = []
+    for path, bounds in thresholds.items():
+        value = lookup(results, path)
+        passed = isinstance(value, (int, float))
+        if passed and 'max' in bounds:
+            passed = value <= bounds['max']
+        if passed and 'min' in bounds:
+            passed = value >= bounds['min']
+        checks.append({'metric': path, 'value': value, **bounds, 'passed': passed})
+    return checks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reports', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--votes', type=int, default=30000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--requests', type=int, default=2000, help='load run size; 0 skips the load run')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--stub-latency', type=float, default=0.0, help='seconds added to Mapbox stub responses')
+    parser.add_argument('--data', help='directory for the dataset (default: a temporary directory)')
+    parser.add_argument('--out', default='bench-results.json')
+    parser.add_argument('--thresholds', default=DEFAULT_THRESHOLDS, help="JSON thresholds file, or '' for none")
+    args = parser.parse_args()
+
+    out_path = os.path.abspath(args.out)
+    thresholds = {}
+    if args.thresholds:
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+
+    workdir = os.path.abspath(args.data) if args.data else tempfile.mkdtemp(prefix='civix-bench-')
+    dataset = generate(args.reports, args.users, args.votes, args.seed)
+    write_dataset(workdir, dataset)
+    _, stub, stub_url = start_stub(latency=args.stub_latency)
+
+    # The app reads its configuration at import and its data from the working directory
+    os.environ['MAPBOX_API_URL'] = stub_url
+    os.environ.setdefault('STORAGE_BACKEND', 'json')
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    start = time.perf_counter()
+    from app.main import app
+    from benchmarks import load, micro
+    startup = time.perf_counter() - start
+
+    client = app.test_client()
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'reports': args.reports,
+            'users': args.users,
+            'votes': len(dataset['votes']),
+            'storage': os.environ['STORAGE_BACKEND'],
+            'data': workdir
+        },
+        'startup_ms': round(startup * 1000, 1),
+        'micro': micro.run_all(client, workdir)
+    }
+    if args.requests:
+        driver = load.LoadDriver(app, dataset['users'], [r['id'] for r in dataset['reports']])
+        results['load'] = driver.run(args.requests, args.concurrency)
+        results['load']['mapboxRequests'] = stub.requests
+
+    results['checks'] = check_thresholds(results, thresholds)
+    failed = [c for c in results['checks'] if not c['passed']]
+    results['passed'] = not failed
+    with open(out_path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    for name, result in results['micro'].items():
+        print(f"{name:<34} {result['mean_us']:>12.1f} us  {result['ops_per_sec']:>12.1f}/s")
+    if 'load' in results:
+        overall = results['load']['overall']
+        print(f"\nload: {overall['requests']} requests, {overall.get('throughput_rps', 0)} req/s, "
+              f"p95 {overall.get('p95_ms', 0)} ms, {overall['errors']} errors")
+    for check in failed:
+        print(f"REGRESSION {check['metric']} = {check['value']} (bounds {check.get('min', '-')}..{check.get('max', '-')})")
+    print(f"\nResults written to {out_path}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()